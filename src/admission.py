@@ -0,0 +1,175 @@
+# admission.py
+"""
+Admission control in front of generation.
+
+A fixed number of generation slots is shared by all callers. Requests that
+cannot get a slot wait in a bounded priority queue (interactive UI ahead of
+batch/API work, FIFO within a class). Each client is rate limited with a token
+bucket, and requests are rejected immediately with a retry hint when the
+client is over its rate or the queue is full, instead of piling onto Ollama.
+"""
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from config import admission_settings
+import heapq
+import itertools
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(RuntimeError):
+    """Raised when a request is not admitted; `retry_after` is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f'{reason}, retry in {retry_after:.1f}s')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+
+    def take(self) -> float:
+        """0 if a token was taken, otherwise seconds until one is available"""
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+
+    def __init__(self, slots: int = None, max_queue: int = None, rate_per_min: float = None, burst: int = None):
+        self.slots = slots or admission_settings['slots']
+        self.max_queue = max_queue if max_queue is not None else admission_settings['max_queue']
+        self.rate = (rate_per_min or admission_settings['rate_per_min']) / 60.0
+        self.burst = burst or admission_settings['burst']
+
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._queue = []
+        self._waiting = 0       # live waiters; cancelled ones stay in the heap until popped
+        self._seq = itertools.count()
+        self._buckets = OrderedDict()
+        self._waits = deque(maxlen=200)
+        self._service = deque(maxlen=50)
+        self._rejected = 0
+
+    def acquire(self, client_id: str = None, priority: str = 'interactive', timeout: float = None):
+        """Block until a slot is granted; raises AdmissionRejected instead of over-queueing"""
+        timeout = timeout if timeout is not None else admission_settings['max_wait']
+        rank = admission_settings['priorities'][priority]
+        start = time.time()
+
+        with self._lock:
+            if client_id is not None:
+                wait_for = self._bucket(client_id).take()
+                if wait_for:
+                    self._rejected += 1
+                    raise AdmissionRejected('Rate limit exceeded', wait_for)
+
+            if self._in_use < self.slots and not self._waiting:
+                self._in_use += 1
+                self._waits.append(0.0)
+                return
+
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise AdmissionRejected('Generation queue is full', self._retry_hint())
+
+            waiter = _Waiter()
+            heapq.heappush(self._queue, (rank, next(self._seq), waiter))
+            self._waiting += 1
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    # Left in the heap and skipped when popped
+                    waiter.cancelled = True
+                    self._waiting -= 1
+                    self._rejected += 1
+                    raise AdmissionRejected('Timed out waiting for a generation slot', self._retry_hint())
+
+        with self._lock:
+            self._waits.append(time.time() - start)
+
+    def release(self, service_time: float = None):
+        with self._lock:
+            if service_time is not None:
+                self._service.append(service_time)
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                # Hand the slot straight to the next waiter; _in_use is unchanged
+                waiter.granted = True
+                self._waiting -= 1
+                waiter.event.set()
+                return
+            self._in_use -= 1
+
+    @contextmanager
+    def slot(self, client_id: str = None, priority: str = 'interactive'):
+        self.acquire(client_id, priority)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.release(time.time() - start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'slots': self.slots,
+                'in_use': self._in_use,
+                'queue_depth': self._waiting,
+                'max_queue': self.max_queue,
+                'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+                'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                'rejected': self._rejected
+            }
+
+    def _bucket(self, client_id: str) -> _TokenBucket:
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = self._buckets[client_id] = _TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > admission_settings['max_clients']:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_id)
+        return bucket
+
+    def _retry_hint(self) -> float:
+        # Time for the slots to drain everyone already queued, from recent service times
+        service = sum(self._service) / len(self._service) if self._service else admission_settings['default_service_time']
+        return max(1.0, service * (self._waiting + 1) / self.slots)
+
+
+_admission_instance = None
+_admission_lock = threading.Lock()
+
+def get_admission_controller():
+    global _admission_instance
+    if _admission_instance is None:
+        with _admission_lock:
+            if _admission_instance is None:
+                _admission_instance = AdmissionController()
+    return _admission_instance
@@ -0,0 +1,229 @@
+# analytics.py
+"""
+Structured fast path for aggregate questions.
+
+Questions such as "What are the highest rated restaurants?" cannot be answered
+from three retrieved reviews. During ingestion the CSV is reduced to a small
+columnar summary (per-restaurant average rating, review count and date range);
+the router below detects ranking/aggregate intents and answers them from that
+summary over the full corpus, without retrieval or, by default, an LLM call.
+"""
+from config import CSV_FILE, analytics_settings
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'ten': 10}
+
+# (intent, pattern, needs a restaurant/place noun) checked in order
+_INTENTS = [
+    ('lowest_rated', re.compile(r'\b(lowest|worst|poorest)([\s-]+(rated|ratings?|reviewed))?\b'), True),
+    ('highest_rated', re.compile(r'\b(highest|best|top)([\s-]+(rated|ratings?|reviewed))?\b'), True),
+    ('most_reviewed', re.compile(r'\bmost (reviewed|reviews|popular)\b'), True),
+    ('review_count', re.compile(r'\bhow many (reviews|restaurants|places)\b'), False),
+    ('average_rating', re.compile(r'\b(average|mean|overall) rating\b'), False),
+]
+
+_RANKED_NOUN = re.compile(r'\b(restaurants?|places?|pizzerias?|spots?|joints?)\b')
+
+# Words an aggregate question can consist of; anything else ("mention delivery",
+# "for gluten free") is a qualifier the summary cannot answer, so retrieval does
+_FILLER = set("""
+    what whats which who s is are was were there the a an of for in on to by me show list give name tell
+    do does did have has all total overall our these those so far currently now please according
+    restaurant restaurants place places pizzeria pizzerias spot spots joint joints
+    review reviews reviewed rated rating ratings number count average mean
+    most popular highest lowest best worst top poorest how many
+""".split())
+
+# "top 3", "best five": the only number an aggregate question may carry
+_LIMIT = re.compile(r'\b(top|best|worst|lowest|highest)\s+(\d+|' + '|'.join(_NUMBER_WORDS) + r')\b')
+
+# "pizza places" names the ranked thing; "the best pizza" asks about the food
+_PIZZA_NOUN = re.compile(r'\bpizza\s+(?=(restaurants?|places?|spots?|joints?)\b)')
+
+
+def build_summary(csv_path: str = CSV_FILE, summary_path: str = None):
+    """Aggregate the review CSV into the columnar summary file"""
+    import pandas as pd
+
+    summary_path = summary_path or analytics_settings['summary_path']
+    start_time = time.time()
+
+    df = pd.read_csv(csv_path)
+    df['Title'] = df['Title'].astype(str).str.strip()
+    df['Rating'] = pd.to_numeric(df['Rating'], errors='coerce')
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+
+    grouped = df.groupby('Title').agg(
+        avg_rating=('Rating', 'mean'),
+        review_count=('Rating', 'size'),
+        first_date=('Date', 'min'),
+        last_date=('Date', 'max')
+    ).reset_index()
+
+    def dates(series):
+        return [d.strftime('%Y-%m-%d') if pd.notna(d) else None for d in series]
+
+    summary = {
+        'source': os.path.basename(csv_path),
+        'total_reviews': int(len(df)),
+        'overall_rating': round(float(df['Rating'].mean()), 2) if len(df) else None,
+        'columns': {
+            'restaurant': grouped['Title'].tolist(),
+            'avg_rating': [round(float(r), 2) if pd.notna(r) else None for r in grouped['avg_rating']],
+            'review_count': [int(c) for c in grouped['review_count']],
+            'first_date': dates(grouped['first_date']),
+            'last_date': dates(grouped['last_date'])
+        }
+    }
+
+    tmp_path = summary_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f)
+    os.replace(tmp_path, summary_path)
+
+    logger.info(f'Review summary built for {len(grouped)} restaurants in {time.time() - start_time:.2f}s')
+    return summary
+
+
+class ReviewSummary:
+
+    def __init__(self, data: dict):
+        self.total_reviews = data['total_reviews']
+        self.overall_rating = data['overall_rating']
+        self.columns = data['columns']
+
+    def __len__(self):
+        return len(self.columns['restaurant'])
+
+    def row(self, i: int) -> dict:
+        return {name: values[i] for name, values in self.columns.items()}
+
+    def ranked(self, by: str, descending: bool = True, limit: int = 5, min_reviews: int = 1):
+        counts = self.columns['review_count']
+        values = self.columns[by]
+        order = [i for i in range(len(self)) if values[i] is not None and counts[i] >= min_reviews]
+        # Ties on the ranking value go to the restaurant with more reviews
+        if descending:
+            order.sort(key=lambda i: (-values[i], -counts[i]))
+        else:
+            order.sort(key=lambda i: (values[i], -counts[i]))
+        return [self.row(i) for i in order[:limit]]
+
+    def find(self, question: str):
+        """Restaurant named in the question, if any"""
+        q = question.lower()
+        matches = [
+            i for i, name in enumerate(self.columns['restaurant'])
+            if name and re.search(r'\b' + re.escape(name.lower()) + r'\b', q)
+        ]
+        if not matches:
+            return None
+        return self.row(max(matches, key=lambda i: len(self.columns['restaurant'][i])))
+
+
+_summary_instance = None
+_summary_lock = threading.Lock()
+
+def get_summary():
+    """Load the summary, building it from the CSV on first use if ingestion has not yet"""
+    global _summary_instance
+    if _summary_instance is None:
+        with _summary_lock:
+            if _summary_instance is None:
+                path = analytics_settings['summary_path']
+                if os.path.exists(path):
+                    with open(path) as f:
+                        data = json.load(f)
+                elif os.path.exists(CSV_FILE):
+                    data = build_summary(CSV_FILE, path)
+                else:
+                    return None
+                _summary_instance = ReviewSummary(data)
+    return _summary_instance
+
+
+def detect_intent(question: str):
+    q = question.lower()
+    for intent, pattern, needs_noun in _INTENTS:
+        if pattern.search(q) and (not needs_noun or _RANKED_NOUN.search(q)):
+            return intent
+    return None
+
+
+def _has_qualifiers(question: str, restaurant: str = None) -> bool:
+    q = question.lower()
+    if restaurant:
+        q = q.replace(restaurant.lower(), ' ')
+    # Any other number ("in 2023", "under 10 dollars") is a qualifier
+    q = _LIMIT.sub(r'\1', q, count=1)
+    q = _PIZZA_NOUN.sub('', q)
+    return any(word not in _FILLER for word in re.findall(r'[a-z0-9]+', q))
+
+
+def _requested_limit(question: str) -> int:
+    match = _LIMIT.search(question.lower())
+    if match:
+        value = match.group(2)
+        limit = int(value) if value.isdigit() else _NUMBER_WORDS[value]
+        return max(1, min(limit, analytics_settings['max_results']))
+    return analytics_settings['default_results']
+
+
+def _format_rows(rows):
+    lines = []
+    for rank, row in enumerate(rows, 1):
+        span = f"{row['first_date']} to {row['last_date']}" if row['first_date'] else 'dates unknown'
+        lines.append(f"{rank}. {row['restaurant']} - {row['avg_rating']:.2f} avg from {row['review_count']} reviews ({span})")
+    return '\n'.join(lines)
+
+
+def answer_aggregate(question: str):
+    """
+    Answer a ranking/aggregate question from the summary.
+    Returns the factual answer text, or None when the question is not aggregate
+    or is qualified in a way only retrieval can answer.
+    """
+    intent = detect_intent(question)
+    if intent is None:
+        return None
+
+    summary = get_summary()
+    if summary is None:
+        return None
+
+    row = summary.find(question) if intent in ('review_count', 'average_rating') else None
+    if _has_qualifiers(question, row['restaurant'] if row else None):
+        return None
+
+    min_reviews = analytics_settings['min_reviews_for_ranking']
+    limit = _requested_limit(question)
+
+    if intent == 'highest_rated':
+        rows = summary.ranked('avg_rating', descending=True, limit=limit, min_reviews=min_reviews)
+        header = f'Highest rated restaurants (at least {min_reviews} reviews):'
+    elif intent == 'lowest_rated':
+        rows = summary.ranked('avg_rating', descending=False, limit=limit, min_reviews=min_reviews)
+        header = f'Lowest rated restaurants (at least {min_reviews} reviews):'
+    elif intent == 'most_reviewed':
+        rows = summary.ranked('review_count', descending=True, limit=limit)
+        header = 'Most reviewed restaurants:'
+    else:
+        if row is not None:
+            return (
+                f"{row['restaurant']} has {row['review_count']} reviews with an average rating of "
+                f"{row['avg_rating']:.2f} ({row['first_date']} to {row['last_date']})."
+            )
+        if intent == 'review_count':
+            return f'There are {summary.total_reviews} reviews across {len(summary)} restaurants.'
+        return f'The average rating across all {summary.total_reviews} reviews is {summary.overall_rating:.2f}.'
+
+    if not rows:
+        return None
+    return f'{header}\n{_format_rows(rows)}'
@@ -0,0 +1,137 @@
+# compression.py
+"""
+Extractive context compression between retrieval and generation.
+
+Retrieved reviews are split into sentences, every sentence is scored against
+the query embedding in one numpy pass, and only the best sentences go into the
+prompt, each tagged with its restaurant and rating. Sentence embeddings are
+cached since the same reviews come back for many questions.
+"""
+from collections import OrderedDict
+from config import compression_settings
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def split_sentences(doc):
+    """(tag, sentence) pairs for one retrieved document"""
+    metadata = getattr(doc, 'metadata', None) or {}
+    tag = f"[{metadata.get('title', 'Unknown')} | Rating : {metadata.get('rating', 'N/A')}]"
+
+    text = doc.page_content
+    if 'Review:' in text:
+        text = text.split('Review:', 1)[1]
+
+    min_chars = compression_settings['min_sentence_chars']
+    return [(tag, s.strip()) for s in _SENTENCE_SPLIT.split(text) if len(s.strip()) >= min_chars]
+
+
+class ContextCompressor:
+
+    def __init__(self, embeddings=None, cache_size: int = None):
+        self._embeddings = embeddings
+        self._cache = OrderedDict()
+        self._cache_size = cache_size or compression_settings['cache_size']
+        self._lock = threading.Lock()
+        # Observed prompt-eval throughput, refined from real Ollama stats when available
+        self.tokens_per_sec = compression_settings['prompt_tokens_per_sec']
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from vector_config import get_embeddings
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def observe_prompt_eval(self, tokens: int, seconds: float):
+        if tokens and seconds:
+            with self._lock:
+                self.tokens_per_sec = 0.8 * self.tokens_per_sec + 0.2 * (tokens / seconds)
+
+    def _sentence_vectors(self, sentences):
+        import numpy as np   # imported on first use, keeps rag_agent's import cheap
+
+        found = {}
+        with self._lock:
+            for sentence in dict.fromkeys(sentences):
+                vector = self._cache.get(sentence)
+                if vector is not None:
+                    found[sentence] = vector
+                    self._cache.move_to_end(sentence)
+
+        missing = [s for s in dict.fromkeys(sentences) if s not in found]
+        if missing:
+            # One batched call for every sentence not seen before
+            vectors = [np.asarray(v, dtype=np.float32) for v in self.embeddings.embed_documents(missing)]
+            found.update(zip(missing, vectors))
+            with self._lock:
+                self._cache.update(zip(missing, vectors))
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+        return np.stack([found[s] for s in sentences])
+
+    def compress(self, question: str, docs, max_sentences: int = None, baseline_chars: int = None):
+        """
+        Returns (context, report). `baseline_chars` is the size of the context that
+        would have been sent uncompressed; savings are measured against it, net of
+        the time spent compressing.
+        """
+        import numpy as np
+
+        start_time = time.time()
+        max_sentences = max_sentences or compression_settings['max_sentences']
+
+        pieces = [piece for doc in docs for piece in split_sentences(doc)]
+        original_chars = baseline_chars or sum(len(doc.page_content) for doc in docs)
+        if not pieces:
+            return '', {'ratio': 0.0, 'original_chars': original_chars, 'compressed_chars': 0,
+                        'compression_time': 0.0, 'saved_seconds': 0.0}
+
+        sentences = [sentence for _, sentence in pieces]
+        matrix = self._sentence_vectors(sentences)
+        # Normally a cache hit: the retriever embedded the same question just before
+        query = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        norms[norms == 0] = 1.0
+        scores = (matrix @ query) / norms
+
+        keep = sorted(np.argsort(-scores)[:max_sentences])   # original order reads better
+
+        lines = []
+        last_tag = None
+        for i in keep:
+            tag, sentence = pieces[i]
+            lines.append(f'{tag} {sentence}' if tag != last_tag else sentence)
+            last_tag = tag
+        context = '\n'.join(lines)
+
+        saved_tokens = max(0, original_chars - len(context)) / compression_settings['chars_per_token']
+        compression_time = time.time() - start_time
+        report = {
+            'ratio': len(context) / original_chars if original_chars else 0.0,
+            'original_chars': original_chars,
+            'compressed_chars': len(context),
+            'compression_time': compression_time,
+            'saved_seconds': saved_tokens / self.tokens_per_sec - compression_time
+        }
+        return context, report
+
+
+_compressor_instance = None
+_compressor_lock = threading.Lock()
+
+def get_compressor():
+    global _compressor_instance
+    if _compressor_instance is None:
+        with _compressor_lock:
+            if _compressor_instance is None:
+                _compressor_instance = ContextCompressor()
+    return _compressor_instance
@@ -36,6 +36,19 @@ Here is the question : {question}
 
 
 
+# Conversation mode splits the persona out so it can be sent once per session
+# as the system prompt and stays a stable, cacheable prefix for Ollama.
+genie_system_prompt = """Your name is - Pizza Genie, your tone is also of a genie. 
+Introduce yourself in your first answer only.
+You are an expert in answering questions about pizza restaurants.
+Word limit - 150 words"""
+
+genie_turn_template = """
+Here are some relevant reviews  : {reviews}
+
+Here is the question : {question}
+"""
+
 genie_template_fast = """Based on these reviews: {reviews}
 
 Answer: {question}"""
@@ -65,4 +78,111 @@ model_settings = {
     'max_tokens' : 300,
     'top_p' : 0.9,
     'repeat_penalty' : 1.1
-}
\ No newline at end of file
+}
+
+conversation_settings = {
+    'max_sessions' : 256,
+    'session_ttl' : 1800,          # seconds of inactivity before a session is evicted
+    'max_context_tokens' : 3072,   # reset Ollama context once it grows past this
+    'summary_turns' : 3,           # turns carried over into a fresh context
+    'summary_chars' : 200,
+    'history_size' : 10,           # display history entries kept per session
+    'num_ctx' : 4096,
+    'keep_alive' : '30m'
+}
+
+prefetch_settings = {
+    'debounce' : 0.4,      # seconds of typing pause before retrieval starts
+    'min_chars' : 12,
+    'workers' : 2,
+    'max_sessions' : 256
+}
+
+snapshot_settings = {
+    'path' : 'data/restaurant_reviews.ragsnap',
+    'prefer_snapshot' : True   # serve from the snapshot when present instead of Chroma
+}
+
+sharding_settings = {
+    'enabled' : False,              # serve from data/shards when built
+    'dir' : 'data/shards',
+    'num_shards' : os.cpu_count() or 1,
+    'start_method' : 'forkserver',  # no fork() of the threaded app; server preloads only shard_worker
+    'timeout' : 10
+}
+
+# Checked with: python src/perf_diagnostics.py --startup
+startup_settings = {
+    'import_budget' : 0.3,   # seconds per entry-point module
+    'modules' : ['main', 'rag_agent', 'vector_config', 'snapshot', 'perf_diagnostics', 'debug_chroma', 'gradio_app']
+}
+
+# Comma separated list, e.g. OLLAMA_HOSTS=http://gpu1:11434,http://gpu2:11434
+ollama_settings = {
+    'hosts' : os.environ.get('OLLAMA_HOSTS', os.environ.get('OLLAMA_HOST', 'http://localhost:11434')).split(','),
+    'connect_timeout' : 2,
+    'generate_deadline' : 120,
+    'embed_deadline' : 10,
+    'embed_batch_size' : 32,         # texts per embed request when embedding documents
+    'embed_deadline_per_text' : 0.5, # added to embed_deadline for each text in a batch
+    'query_cache_size' : 256,        # recent query embeddings, reused by retrieval and compression
+    'hedge_after' : 0.25,        # seconds before a duplicate query embedding is sent
+    'hedge_workers' : 8,
+    'failure_threshold' : 3,     # consecutive failures before a host is ejected
+    'cooldown' : 30,
+    'max_connections' : 8
+}
+
+dedup_settings = {
+    'index_path' : 'data/minhash_index.pkl',
+    'shingle_size' : 5,     # words per shingle
+    'num_perm' : 64,
+    'bands' : 8,            # 8 bands x 8 rows -> candidates from ~0.77 Jaccard
+    'threshold' : 0.8       # estimated Jaccard to count as a duplicate
+}
+
+app_settings = {
+    'concurrency_limit' : 16,   # concurrent Gradio event handlers
+    'max_queue_size' : 64
+}
+
+analytics_settings = {
+    'summary_path' : 'data/review_summary.json',
+    'default_results' : 5,
+    'max_results' : 20,
+    'min_reviews_for_ranking' : 2,   # keep one-review restaurants out of rankings
+    'phrase_with_llm' : False        # True: the LLM rewrites the facts in the genie's voice
+}
+
+# Used by: python src/embedding_eval.py
+eval_settings = {
+    'grid' : [
+        {'k' : 3, 'fetch_k' : 10, 'lambda_mult' : 0.7},
+        {'k' : 3, 'fetch_k' : 20, 'lambda_mult' : 0.7},
+        {'k' : 5, 'fetch_k' : 20, 'lambda_mult' : 0.5},
+        {'k' : 5, 'fetch_k' : 20, 'lambda_mult' : 1.0}
+    ],
+    'sampled_queries' : 100,   # known-item queries when no labeled set is given
+    'batch_size' : 50,
+    'stub_dims' : {'large' : 1024, 'base' : 768, 'small' : 384}
+}
+
+compression_settings = {
+    'enabled' : True,
+    'max_sentences' : 6,
+    'min_sentence_chars' : 15,
+    'cache_size' : 5000,           # sentence embeddings kept in memory
+    'chars_per_token' : 4,
+    'prompt_tokens_per_sec' : 150  # CPU prompt-eval estimate until real stats arrive
+}
+
+admission_settings = {
+    'slots' : 2,                  # concurrent generations sent to Ollama
+    'max_queue' : 16,             # waiting requests before fast rejection
+    'max_wait' : 60,              # seconds a request may wait for a slot
+    'rate_per_min' : 20,          # per-client token bucket refill
+    'burst' : 5,
+    'max_clients' : 10000,
+    'default_service_time' : 10,  # seconds, used for retry hints before any data
+    'priorities' : {'interactive' : 0, 'batch' : 1}
+}
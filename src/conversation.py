@@ -0,0 +1,142 @@
+# conversation.py
+from collections import OrderedDict, deque
+from config import conversation_settings
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _summarize(turns) -> str:
+    limit = conversation_settings['summary_chars']
+    lines = []
+    for turn in turns:
+        lines.append(f"Q: {turn['question'][:limit]}")
+        lines.append(f"A: {turn['answer'][:limit]}")
+    return '\n'.join(lines)
+
+
+class ConversationSession:
+    """
+    Per-session state for multi-turn chat.
+
+    `context` holds the token array returned by Ollama's generate endpoint. Passing
+    it back on the next turn means the persona and earlier turns are already a
+    cached prefix, so only the new reviews and question are prompt-evaluated.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        # Serializes turns of one session; different sessions never share a lock
+        self.lock = threading.RLock()
+        self.history = deque(maxlen=conversation_settings['history_size'])
+        self.turns = []
+        self.turn_count = 0
+        self.context = None
+        self.summary = ''
+        # Turns answered without the model (analytics), not yet in `context`
+        self.pending = []
+        self.last_stats = {}
+        self.last_used = time.time()
+
+    def add_turn(self, question: str, answer: str, context=None, in_context: bool = True):
+        """
+        Record a turn. `in_context=False` is for answers that never went through
+        generate: the Ollama context is kept and the turn is replayed as text in
+        the next generated prompt.
+        """
+        turn = {'question': question, 'answer': answer}
+        self.turns.append(turn)
+        self.turn_count += 1
+        if in_context:
+            self.context = context
+            self.pending = []
+        else:
+            self.pending.append(turn)
+        self.last_used = time.time()
+
+        # Only the last few turns are ever needed to rebuild a summary
+        keep = conversation_settings['summary_turns']
+        if len(self.turns) > keep:
+            self.turns = self.turns[-keep:]
+
+    def context_tokens(self) -> int:
+        return len(self.context) if self.context else 0
+
+    def needs_reset(self) -> bool:
+        return self.context_tokens() > conversation_settings['max_context_tokens']
+
+    def reset_context(self):
+        """Drop the Ollama context and fold recent turns into a short text summary"""
+        self.summary = _summarize(self.turns)
+        self.context = None
+        self.pending = []
+
+    def history_prompt(self) -> str:
+        """Earlier turns the model can't see through `context`, as prompt text"""
+        earlier = self.summary if self.context is None else ''
+        return '\n'.join(part for part in (earlier, _summarize(self.pending)) if part)
+
+    def record(self, entry: dict):
+        """Append a display-history entry (question, answer, timing) for the UI"""
+        self.history.append(entry)
+        self.last_used = time.time()
+
+    def clear(self):
+        self.history.clear()
+        self.turns = []
+        self.turn_count = 0
+        self.context = None
+        self.summary = ''
+        self.pending = []
+        self.last_stats = {}
+
+
+class ConversationStore:
+    """LRU + TTL bounded store of conversation sessions"""
+
+    def __init__(self, max_sessions: int = None, ttl: float = None):
+        self.max_sessions = max_sessions or conversation_settings['max_sessions']
+        self.ttl = ttl or conversation_settings['session_ttl']
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationSession:
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ConversationSession(session_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    logger.info(f'Evicted conversation session : {evicted}')
+            else:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [sid for sid, s in self._sessions.items() if s.last_used < cutoff]
+        for sid in expired:
+            del self._sessions[sid]
+
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+def get_conversation_store():
+    global _conversation_store
+    if _conversation_store is None:
+        with _conversation_store_lock:
+            if _conversation_store is None:
+                _conversation_store = ConversationStore()
+    return _conversation_store
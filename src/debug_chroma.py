@@ -1,8 +1,9 @@
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-import os
 from config import DATA_PATH, EMBEDDING_MODEL
-try:
+
+def main():
+    from langchain_chroma import Chroma
+    from langchain_ollama import OllamaEmbeddings
+
     embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
 
     vector_store = Chroma(
@@ -23,5 +24,9 @@ try:
         print(f'\n--- Document {i+1} ---')
         print(f'Content : {doc.page_content}')
         print(f'Metadata : {doc.metadata}')
-except Exception as e:
-    print(f'error occured : {e}')
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f'error occured : {e}')
@@ -0,0 +1,165 @@
+# dedup.py
+"""
+Near-duplicate review detection with MinHash + LSH.
+
+Each document is reduced to word shingles and a MinHash signature. Signatures
+are split into bands; documents sharing any band bucket are candidates, and a
+candidate is a duplicate when its estimated Jaccard similarity passes the
+threshold. Buckets are scoped by restaurant, so a review is only folded into a
+copy under the same title; the same text posted for another restaurant stays
+retrievable for it. Only one representative per group gets embedded, and it
+carries the number of folded copies in its `duplicates` metadata.
+
+The signature index is persisted next to the vector store so later batches are
+checked against everything already ingested.
+"""
+from config import dedup_settings
+import numpy as np
+import os
+import pickle
+import re
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text: str, size: int = None):
+    size = size or dedup_settings['shingle_size']
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class SignatureIndex:
+
+    def __init__(self, num_perm: int = None, bands: int = None, threshold: float = None, seed: int = 1):
+        self.num_perm = num_perm or dedup_settings['num_perm']
+        self.bands = bands or dedup_settings['bands']
+        self.threshold = threshold or dedup_settings['threshold']
+        if self.num_perm % self.bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.rows = self.num_perm // self.bands
+
+        # a, b < 2**31 keep a * hash + b inside uint64 for 32-bit shingle hashes
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, self.num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, self.num_perm).astype(np.uint64)
+
+        self.ids = []
+        self.scopes = []
+        self.signatures = []
+        self.counts = {}
+        self.buckets = [dict() for _ in range(self.bands)]
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in shingles(text)), dtype=np.uint64
+        )[:, None]
+        permuted = (hashes * self._a + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray, scope: str):
+        for band in range(self.bands):
+            yield band, (scope, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+
+    def find(self, signature: np.ndarray, scope: str = ''):
+        """Best matching representative id within the scope above the threshold, or None"""
+        candidates = set()
+        for band, key in self._band_keys(signature, scope):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        best, best_score = None, self.threshold
+        for position in candidates:
+            score = float(np.mean(self.signatures[position] == signature))
+            if score >= best_score:
+                best, best_score = position, score
+        return None if best is None else self.ids[best]
+
+    def add(self, doc_id: str, signature: np.ndarray, scope: str = ''):
+        position = len(self.ids)
+        self.ids.append(doc_id)
+        self.scopes.append(scope)
+        self.signatures.append(signature)
+        self.counts[doc_id] = 0
+        for band, key in self._band_keys(signature, scope):
+            self.buckets[band].setdefault(key, []).append(position)
+
+    def deduplicate(self, documents, ids):
+        """
+        Split a batch into representatives to embed and duplicates to fold.
+        Returns (documents, ids, updated) where `updated` maps previously ingested
+        representative ids to their new duplicate counts.
+        """
+        known = set(self.ids)
+        kept_docs, kept_ids, updated = [], [], {}
+        batch_reps = {}
+
+        for doc, doc_id in zip(documents, ids):
+            signature = self.signature(doc.page_content)
+            scope = str(doc.metadata.get('title', ''))
+            match = self.find(signature, scope)
+            if match is None:
+                self.add(doc_id, signature, scope)
+                batch_reps[doc_id] = doc
+                kept_docs.append(doc)
+                kept_ids.append(doc_id)
+                continue
+
+            self.counts[match] += 1
+            if match in known:
+                updated[match] = self.counts[match]
+
+        for doc_id, doc in batch_reps.items():
+            doc.metadata['duplicates'] = self.counts[doc_id]
+
+        folded = len(ids) - len(kept_ids)
+        logger.info(f'Dedup: {len(kept_ids)} representatives, {folded} near-duplicates folded')
+        return kept_docs, kept_ids, updated
+
+    def save(self, path: str = None):
+        path = path or dedup_settings['index_path']
+        state = {
+            'num_perm': self.num_perm, 'bands': self.bands, 'threshold': self.threshold,
+            'ids': self.ids, 'scopes': self.scopes, 'signatures': np.asarray(self.signatures, dtype=np.uint32),
+            'counts': self.counts
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = None):
+        """Load a saved index, or start an empty one if none exists yet"""
+        path = path or dedup_settings['index_path']
+        if not os.path.exists(path):
+            return cls()
+
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        index = cls(num_perm=state['num_perm'], bands=state['bands'], threshold=state['threshold'])
+        scopes = state.get('scopes') or [''] * len(state['ids'])
+        for doc_id, signature, scope in zip(state['ids'], state['signatures'], scopes):
+            index.add(doc_id, signature, scope)
+        index.counts.update(state['counts'])
+        logger.info(f'Loaded signature index with {len(index.ids)} representatives')
+        return index
+
+
+def apply_duplicate_counts(collection, updated: dict):
+    """Write new duplicate counts onto representatives already stored in Chroma"""
+    if not updated:
+        return
+    rep_ids = list(updated)
+    existing = collection.get(ids=rep_ids, include=['metadatas'])
+    metadatas = []
+    for doc_id, metadata in zip(existing['ids'], existing['metadatas']):
+        metadata = dict(metadata or {})
+        metadata['duplicates'] = updated[doc_id]
+        metadatas.append(metadata)
+    collection.update(ids=existing['ids'], metadatas=metadatas)
@@ -0,0 +1,207 @@
+# embedding_eval.py
+"""
+Speed/quality evaluation of the embedding models in config.EMBEDDING_MODELS.
+
+For every model an index is built (as a snapshot file, so its on-disk size is
+measured too) and every retrieval setting in eval_settings['grid'] is run over
+a labeled query set. Reported per configuration: recall@k, MRR, ingestion
+throughput, query latency (p50/p95) and index size, with Pareto-optimal rows
+(recall vs. query latency) marked.
+
+Query sets are JSON lists of {"query": "...", "relevant": ["doc_id", ...]}.
+Without one, known-item queries are sampled from the reviews themselves.
+
+Usage:
+    python src/embedding_eval.py                       # real Ollama models
+    python src/embedding_eval.py --stub                # offline, deterministic
+    python src/embedding_eval.py --queries data/eval_queries.json --models small,base
+"""
+from config import CSV_FILE, EMBEDDING_MODELS, eval_settings
+from snapshot import write_snapshot, SnapshotRetriever, IndexSnapshot
+import numpy as np
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StubEmbeddings:
+    """
+    Deterministic hashed bag-of-words embedder. Each model name seeds its own
+    hash space and dimension, so models rank differently but reproducibly.
+    """
+
+    def __init__(self, model: str, dim: int):
+        self.model = model
+        self.dim = dim
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r'\w+', text.lower()):
+            h = zlib.crc32(f'{self.model}:{token}'.encode('utf-8'))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str):
+        return self._embed(text)
+
+
+def make_embeddings(alias: str, stub: bool):
+    model = EMBEDDING_MODELS[alias]
+    if stub:
+        return StubEmbeddings(model, eval_settings['stub_dims'][alias])
+    from pooled_models import PooledOllamaEmbeddings
+    return PooledOllamaEmbeddings(model=model)
+
+
+def sample_known_item_queries(documents, ids, count: int, seed: int = 0):
+    """Take a span of words from random reviews as the query; that review is the target"""
+    rng = random.Random(seed)
+    picks = rng.sample(range(len(documents)), min(count, len(documents)))
+    queries = []
+    for i in picks:
+        review = documents[i].page_content.split('Review:', 1)[-1]
+        words = review.split()
+        if len(words) < 6:
+            continue
+        span = rng.randint(4, min(10, len(words)))
+        start = rng.randint(0, len(words) - span)
+        queries.append({'query': ' '.join(words[start:start + span]), 'relevant': [ids[i]]})
+    return queries
+
+
+def score_queries(retriever, queries, k: int):
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for item in queries:
+        relevant = set(item['relevant'])
+        start = time.perf_counter()
+        docs = retriever.invoke(item['query'])
+        latencies.append(time.perf_counter() - start)
+
+        retrieved = [doc.metadata.get('doc_id') for doc in docs[:k]]
+        hits = [doc_id for doc_id in retrieved if doc_id in relevant]
+        recalls.append(len(hits) / len(relevant))
+        rank = next((r for r, doc_id in enumerate(retrieved, 1) if doc_id in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    return {
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'mrr': float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        'latency_p50': float(np.percentile(latencies, 50)) if latencies else 0.0,
+        'latency_p95': float(np.percentile(latencies, 95)) if latencies else 0.0
+    }
+
+
+def evaluate_model(alias: str, documents, ids, queries, stub: bool, workdir: str):
+    embeddings = make_embeddings(alias, stub)
+    texts = [doc.page_content for doc in documents]
+
+    start = time.perf_counter()
+    vectors = []
+    batch_size = eval_settings['batch_size']
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+    ingest_time = time.perf_counter() - start
+
+    path = os.path.join(workdir, f'{alias}.ragsnap')
+    write_snapshot(path, ids, texts, [doc.metadata for doc in documents], vectors, embedding_model=embeddings.model)
+    snapshot = IndexSnapshot(path)
+
+    rows = []
+    for setting in eval_settings['grid']:
+        # A fresh embedder per setting: the pooled one caches query vectors, which
+        # would make every setting after the first skip query embedding
+        retriever = SnapshotRetriever(snapshot, make_embeddings(alias, stub), **setting)
+        scores = score_queries(retriever, queries, setting['k'])
+        rows.append({
+            'model': alias,
+            **setting,
+            **scores,
+            'docs_per_sec': len(texts) / ingest_time if ingest_time else float('inf'),
+            'index_mb': os.path.getsize(path) / 1e6
+        })
+        logger.info(f"{alias} {setting} recall@{setting['k']}={scores['recall']:.3f} mrr={scores['mrr']:.3f}")
+    return rows
+
+
+def mark_pareto(rows):
+    """A row is Pareto-optimal if no other row has >= recall and <= p50 latency, one strictly"""
+    for row in rows:
+        row['pareto'] = not any(
+            other is not row
+            and other['recall'] >= row['recall'] and other['latency_p50'] <= row['latency_p50']
+            and (other['recall'] > row['recall'] or other['latency_p50'] < row['latency_p50'])
+            for other in rows
+        )
+    return rows
+
+
+def print_report(rows):
+    print('\n Embedding Model Evaluation')
+    print('=' * 110)
+    print(f"{'model':<7}{'k':>3}{'fetch_k':>9}{'lambda':>8}{'recall@k':>10}{'MRR':>8}"
+          f"{'docs/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'index MB':>10}  pareto")
+    print('-' * 110)
+    for row in sorted(rows, key=lambda r: (-r['recall'], r['latency_p50'])):
+        print(f"{row['model']:<7}{row['k']:>3}{row['fetch_k']:>9}{row['lambda_mult']:>8.2f}"
+              f"{row['recall']:>10.3f}{row['mrr']:>8.3f}{row['docs_per_sec']:>10.1f}"
+              f"{row['latency_p50'] * 1000:>9.1f}{row['latency_p95'] * 1000:>9.1f}{row['index_mb']:>10.2f}"
+              f"  {'*' if row['pareto'] else ''}")
+    print('=' * 110)
+
+
+def run_evaluation(models=None, queries_path: str = None, csv_path: str = CSV_FILE, stub: bool = False, output: str = None):
+    from vector_config import load_data_from_csv
+
+    documents, ids = load_data_from_csv(csv_path)
+    if not documents:
+        raise ValueError(f'No documents loaded from {csv_path}')
+
+    if queries_path:
+        with open(queries_path) as f:
+            queries = json.load(f)
+    else:
+        queries = sample_known_item_queries(documents, ids, eval_settings['sampled_queries'])
+    logger.info(f'Evaluating {len(queries)} queries over {len(documents)} documents')
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for alias in models or list(EMBEDDING_MODELS):
+            rows.extend(evaluate_model(alias, documents, ids, queries, stub, workdir))
+
+    mark_pareto(rows)
+    print_report(rows)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Evaluate embedding models for speed and retrieval quality')
+    parser.add_argument('--models', help='comma separated aliases from EMBEDDING_MODELS')
+    parser.add_argument('--queries', help='labeled query set (JSON)')
+    parser.add_argument('--csv', default=CSV_FILE)
+    parser.add_argument('--stub', action='store_true', help='use the deterministic offline embedder')
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    run_evaluation(
+        models=args.models.split(',') if args.models else None,
+        queries_path=args.queries,
+        csv_path=args.csv,
+        stub=args.stub,
+        output=args.output
+    )
@@ -1,29 +1,39 @@
 # gradio_appy.py
-
-import gradio as gr
-from langchain_ollama.llms import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+# gradio is imported in build_interface() and the vector store is opened by
+# get_components(), so importing this module stays within the startup budget.
 from vector_config import create_vectorstore
-from config import models, genie_template, EMBEDDING_MODEL
-from rag_agent import create_chain, handle_question
+from config import models, genie_template, EMBEDDING_MODEL, app_settings
+from conversation import get_conversation_store
+from admission import get_admission_controller
+from prefetch import RetrievalPrefetcher
+from rag_agent import create_chain, handle_question, handle_conversation, clear_conversation
+import threading
 import time 
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-logger.info("Initializing RAG components...")
-startup_start = time.time()
+_components = None
+_components_lock = threading.Lock()
 
-retriever = create_vectorstore()
-chain = create_chain(models['llama1b'], genie_template)
+def get_components():
+    """(retriever, chain, prefetcher), built once; launch builds them before serving"""
+    global _components
+    if _components is None:
+        with _components_lock:
+            if _components is None:
+                logger.info("Initializing RAG components...")
+                startup_start = time.time()
 
-startup_time = time.time() - startup_start
-logger.info(f'Startup completed in {startup_time:.2f}sec')
+                retriever = create_vectorstore()
+                chain = create_chain(models['llama1b'], genie_template)
+                _components = (retriever, chain, RetrievalPrefetcher(retriever))
 
-chat_history = []
+                startup_time = time.time() - startup_start
+                logger.info(f'Startup completed in {startup_time:.2f}sec')
+    return _components
 
-def genie_chat(question, history = None):
+def genie_chat(question, history = None, session_id = None, client_id = None):
     if not question or not question.strip():
         return 'Kindly ask me your query!'
     
@@ -35,153 +45,198 @@ def genie_chat(question, history = None):
     try:
         start_time = time.time()
         logger.info('Processing : {question[:50]}...')
+        retriever, chain, prefetcher = get_components()
 
-        result = handle_question(chain, retriever, question)
+        if session_id:
+            # Reuse retrieval speculatively started while the user was typing
+            docs = prefetcher.take(session_id, question)
+            result, _ = handle_conversation(models['llama1b'], retriever, question, session_id, docs, client_id=client_id)
+        else:
+            result = handle_question(chain, retriever, question, client_id=client_id)
 
         response_time = time.time() - start_time
         logger.info(f'Response granted in {response_time:.2f}s')
 
-        chat_history.append({
-            'question' : question,
-            'answer' : result,
-            'timestamp' : time.strftime('%H:%M:%S'),
-            'response_time' : f'{response_time:.2f}s'
-        })
-
-        if len(chat_history) > 10:
-            chat_history.pop(0)
+        # History lives on the caller's session, bounded, never shared across users;
+        # callers without a session get no history rather than a shared one
+        if session_id:
+            get_conversation_store().get(session_id).record({
+                'question' : question,
+                'answer' : result,
+                'timestamp' : time.strftime('%H:%M:%S'),
+                'response_time' : f'{response_time:.2f}s'
+            })
 
         return result
     except Exception as e:
         logging.error(f'Error occured : {e}')
         return f'Something went wrong : {str(e)}'
     
-def get_chat_history():
-    if not chat_history:
-        return 'No conversation history yet.'
+def build_interface():
+    import gradio as gr
+
+    def get_chat_history(request: gr.Request = None):
+        if request is None or not request.session_hash:
+            return 'No conversation history yet.'
+        chat_history = list(get_conversation_store().get(request.session_hash).history)
+        if not chat_history:
+            return 'No conversation history yet.'
     
-    history_text = '*' * 5 + 'Recent Conversations:' + '*' * 5 + '\n\n'
-    for i, chat in enumerate(chat_history[-5:], 1):
-        history_text += f"**{i}. [{chat['timestamp']}] ({chat['response_time']})**\n"
-        history_text += f"Q: {chat['question'][:100]}...\n"
-        history_text += f"A: {chat['answer'][:200]}...\n\n"
-
-    return history_text
-
-def clear_history():
-    global chat_history
-    chat_history = []
-    return 'Chat history cleared!'
-
-with gr.Blocks(
-    title = 'Restaurant Genie - RAG App',
-    theme = gr.themes.Soft(),
-    css = """
-    .container { max-width: 800px; margin: auto; }
-    .header { text-align: center; padding: 20px; }
-    .performance-info {
-        background : #f4f4f4;
-        padding : 12px;
-        border-radius : 4px;
-        margin : 12px 0;
-        font-size : 12px;
-    }
-    """
-) as interface:
+        history_text = '*' * 5 + 'Recent Conversations:' + '*' * 5 + '\n\n'
+        for i, chat in enumerate(chat_history[-5:], 1):
+            history_text += f"**{i}. [{chat['timestamp']}] ({chat['response_time']})**\n"
+            history_text += f"Q: {chat['question'][:100]}...\n"
+            history_text += f"A: {chat['answer'][:200]}...\n\n"
+
+        return history_text
+
+    def clear_history(request: gr.Request = None):
+        if request is not None and request.session_hash:
+            clear_conversation(request.session_hash)
+        return 'Chat history cleared!'
+
+    with gr.Blocks(
+        title = 'Restaurant Genie - RAG App',
+        theme = gr.themes.Soft(),
+        css = """
+        .container { max-width: 800px; margin: auto; }
+        .header { text-align: center; padding: 20px; }
+        .performance-info {
+            background : #f4f4f4;
+            padding : 12px;
+            border-radius : 4px;
+            margin : 12px 0;
+            font-size : 12px;
+        }
+        """
+    ) as interface:
     
-    gr.Markdown("""
-    # Restaurant Genie - RAG App
-    ### Ask anything about restaurant reviews, ratings, or recommendations !
-    ### It utilises Llama 3.2 Model with 1B params and Vector Search using Chroma
-    """, elem_classes=['header']
-    )
-
-    with gr.Row():
-        with gr.Column(scale=3):
-            question_input = gr.Textbox(
-                label = 'Ask the restaurant genie',
-                placeholder='e.g. Which is the best pizza place?',
-                lines = 2
-            )
+        gr.Markdown("""
+        # Restaurant Genie - RAG App
+        ### Ask anything about restaurant reviews, ratings, or recommendations !
+        ### It utilises Llama 3.2 Model with 1B params and Vector Search using Chroma
+        """, elem_classes=['header']
+        )
+
+        with gr.Row():
+            with gr.Column(scale=3):
+                question_input = gr.Textbox(
+                    label = 'Ask the restaurant genie',
+                    placeholder='e.g. Which is the best pizza place?',
+                    lines = 2
+                )
         
-            with gr.Row():
-                submit_btn = gr.Button('Ask Genie', variant='primary', scale=1)
-                clear_btn = gr.Button('Clear history', scale=1)
-
-            answer_output = gr.Textbox(
-                label = "Genie's Reply",
-                lines = 8,
-                max_lines=15
-            )
+                with gr.Row():
+                    submit_btn = gr.Button('Ask Genie', variant='primary', scale=1)
+                    clear_btn = gr.Button('Clear history', scale=1)
+
+                answer_output = gr.Textbox(
+                    label = "Genie's Reply",
+                    lines = 8,
+                    max_lines=15
+                )
         
-        with gr.Column(scale=1):
-            gr.Markdown('### Performance Info')
-            performance_info = gr.Textbox(
-                label = 'Last Response Time',
-                value = 'Ready to serve!',
-                lines = 2,
-                interactive=False
-            )
-
-            history_btn = gr.Button('Show history')
-            history_output = gr.Textbox(
-                label = 'Chat History',
-                lines = 6,
-                interactive= False
-            )
-
-            history_btn = gr.Button("📚 Show History")
-            history_output = gr.Textbox(
-                label="Chat History",
-                lines=6,
-                interactive=False
+            with gr.Column(scale=1):
+                gr.Markdown('### Performance Info')
+                performance_info = gr.Textbox(
+                    label = 'Last Response Time',
+                    value = 'Ready to serve!',
+                    lines = 6,
+                    interactive=False
+                )
+
+                history_btn = gr.Button('Show history')
+                history_output = gr.Textbox(
+                    label = 'Chat History',
+                    lines = 6,
+                    interactive= False
+                )
+
+                history_btn = gr.Button("📚 Show History")
+                history_output = gr.Textbox(
+                    label="Chat History",
+                    lines=6,
+                    interactive=False
+                )
+    
+        # Example questions
+        gr.Markdown("""
+        ### 💡 Example Questions:
+        - "What are the highest rated restaurants?"
+        - "Show me restaurants with poor service"
+        - "Which places have the best pizza?"
+        - "Tell me about Italian restaurants"
+        - "What do people complain about most?"
+        """)
+
+        def submit_with_performance(question, request: gr.Request):
+            start = time.time()
+            # Rate limited per client address: the session hash changes on every page reload
+            client_id = request.client.host if request.client else None
+            response = genie_chat(question, session_id=request.session_hash, client_id=client_id)
+            duration = time.time() - start
+            perf_info = f"Response Time: {duration:.2f}s\nModel: Llama 3.2 1B\nEmbedding: {EMBEDDING_MODEL}"
+            stats = get_conversation_store().get(request.session_hash).last_stats
+            if stats:
+                perf_info += f"\nTurn {stats['turn']} | Prompt eval: {stats['prompt_eval_count']} tokens in {stats['prompt_eval_time']:.2f}s"
+                perf_info += f"\nContext kept: {stats['compression_ratio']:.0%} | {stats['compression_saved']:+.2f}s net saved"
+            admission = get_admission_controller().stats()
+            perf_info += (
+                f"\nSlots: {admission['in_use']}/{admission['slots']} | Queue: {admission['queue_depth']}/{admission['max_queue']}"
+                f"\nWait p50/p95: {admission['wait_p50']:.2f}s/{admission['wait_p95']:.2f}s | Rejected: {admission['rejected']}"
             )
+            return response, perf_info
     
-    # Example questions
-    gr.Markdown("""
-    ### 💡 Example Questions:
-    - "What are the highest rated restaurants?"
-    - "Show me restaurants with poor service"
-    - "Which places have the best pizza?"
-    - "Tell me about Italian restaurants"
-    - "What do people complain about most?"
-    """)
-
-    def submit_with_performance(question):
-        start = time.time()
-        response = genie_chat(question)
-        duration = time.time() - start
-        perf_info = f"Response Time: {duration:.2f}s\nModel: Llama 3.2 1B\nEmbedding: {EMBEDDING_MODEL}"
-        return response, perf_info
+        def prefetch_question(question, request: gr.Request):
+            _, _, prefetcher = get_components()
+            prefetcher.schedule(request.session_hash, question)
+
+        question_input.change(
+            fn=prefetch_question,
+            inputs=[question_input],
+            outputs=None,
+            queue=False,
+            show_progress='hidden'
+        )
+
+        submit_btn.click(
+            fn=submit_with_performance,
+            inputs=[question_input],
+            outputs=[answer_output, performance_info]
+        )
     
-    submit_btn.click(
-        fn=submit_with_performance,
-        inputs=[question_input],
-        outputs=[answer_output, performance_info]
-    )
+        question_input.submit(
+            fn=submit_with_performance,
+            inputs=[question_input],
+            outputs=[answer_output, performance_info]
+        )
     
-    question_input.submit(
-        fn=submit_with_performance,
-        inputs=[question_input],
-        outputs=[answer_output, performance_info]
-    )
-    
-    history_btn.click(
-        fn=get_chat_history,
-        outputs=[history_output]
-    )
+        history_btn.click(
+            fn=get_chat_history,
+            outputs=[history_output]
+        )
     
-    clear_btn.click(
-        fn=clear_history,
-        outputs=[history_output]
-    )
+        clear_btn.click(
+            fn=clear_history,
+            outputs=[history_output]
+        )
+
+    return interface
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # Open the store and build the chain before accepting the first request
+    get_components()
+    interface = build_interface()
+
     logger.info('Launching Gradio interfcae...')
+    interface.queue(
+        default_concurrency_limit = app_settings['concurrency_limit'],
+        max_size = app_settings['max_queue_size']
+    )
     interface.launch(
         share = True,
         server_name = '0.0.0.0',
         server_port=7860,
         show_error=True
     )
-
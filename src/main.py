@@ -1,14 +1,20 @@
 # main.py
-from langchain_ollama.llms import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+from concurrent.futures import ThreadPoolExecutor
 from vector_config import create_vectorstore
-from rag_agent import create_chain, handle_question
+from rag_agent import create_chain, handle_question, handle_conversation
 from config import models, genie_template
-import time 
+import sys
+import logging
 
 def main():
-    retriever = create_vectorstore()
-    chain = create_chain(models['llama1b'], genie_template)
+    # --chat keeps Ollama context between questions so follow-ups are cheaper
+    conversation_mode = '--chat' in sys.argv
+
+    # Opening the vector store and building the chain both pull in heavy imports;
+    # do them while the user types the first question
+    warmup = ThreadPoolExecutor(max_workers=2)
+    retriever_future = warmup.submit(create_vectorstore)
+    chain_future = warmup.submit(create_chain, models['llama1b'], genie_template)
 
     try:
         while True:
@@ -20,12 +26,22 @@ def main():
 
             
             print('🧞‍♂️✨ Genie is brewing your solution... 🧪\n')
-            result = handle_question(chain, retriever, question)
+            retriever = retriever_future.result()
+            if conversation_mode:
+                result, _ = handle_conversation(models['llama1b'], retriever, question, 'cli')
+            else:
+                result = handle_question(chain_future.result(), retriever, question, priority='interactive')
             print(result)
             print('\n------')
 
     except Exception as e:
         print(f'Error occured : {e}')
+    finally:
+        # Don't wait on warm-up work nobody needs any more; cancel what hasn't started
+        warmup.shutdown(wait=False, cancel_futures=True)
+        if retriever_future.running():
+            print('Finishing vector store ingestion before exit...')
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
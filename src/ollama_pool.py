@@ -0,0 +1,221 @@
+# ollama_pool.py
+"""
+Shared client layer for every Ollama call.
+
+A pool of endpoints (one keep-alive HTTP connection pool each) is balanced by
+in-flight request count. Every call carries a deadline, embedding calls can be
+hedged with a duplicate request to a second host, and a circuit breaker ejects
+hosts after repeated failures until a cooldown has passed.
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config import ollama_settings
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NoHealthyEndpoint(RuntimeError):
+    pass
+
+
+class OllamaEndpoint:
+    """One Ollama host: connection pools keyed by deadline plus health state"""
+
+    def __init__(self, host: str, failure_threshold: int = None, cooldown: float = None):
+        self.host = host
+        self.failure_threshold = failure_threshold or ollama_settings['failure_threshold']
+        self.cooldown = cooldown if cooldown is not None else ollama_settings['cooldown']
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False  # half-open: one trial request is in flight
+        self.latency = None   # EWMA of successful call latency, seconds
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, deadline: float):
+        # httpx enforces the deadline on the socket, so a stuck generation cannot pin a worker
+        with self._lock:
+            if deadline not in self._clients:
+                import httpx
+                from ollama import Client
+                self._clients[deadline] = Client(
+                    host=self.host,
+                    timeout=httpx.Timeout(deadline, connect=ollama_settings['connect_timeout']),
+                    limits=httpx.Limits(
+                        max_connections=ollama_settings['max_connections'],
+                        max_keepalive_connections=ollama_settings['max_connections']
+                    )
+                )
+            return self._clients[deadline]
+
+    def half_open(self, now: float) -> bool:
+        return self.open_until > 0 and now >= self.open_until
+
+    def available(self, now: float) -> bool:
+        # After the cooldown only a single trial request goes through until it reports back
+        if self.half_open(now):
+            return not self.probing
+        return now >= self.open_until
+
+    def admit(self, now: float):
+        """Called by the pool for the endpoint it picked"""
+        with self._lock:
+            if self.half_open(now):
+                self.probing = True
+
+    def record_success(self, elapsed: float):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.probing = False
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                # A failed trial request re-opens the breaker for another full cooldown
+                self.probing = False
+                self.open_until = time.time() + self.cooldown
+                logger.warning(f'Ejecting Ollama host {self.host} for {self.cooldown}s after {self.failures} failures')
+
+    def snapshot(self) -> dict:
+        return {
+            'host': self.host,
+            'in_flight': self.in_flight,
+            'failures': self.failures,
+            'ejected': time.time() < self.open_until,
+            'probing': self.probing,
+            'latency': self.latency
+        }
+
+
+class OllamaPool:
+
+    def __init__(self, hosts: list = None, failure_threshold: int = None, cooldown: float = None):
+        hosts = hosts or ollama_settings['hosts']
+        self.endpoints = [
+            OllamaEndpoint(host.strip().rstrip('/'), failure_threshold, cooldown)
+            for host in hosts if host.strip()
+        ]
+        if not self.endpoints:
+            raise ValueError('No Ollama hosts configured')
+        self._lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=ollama_settings['hedge_workers'], thread_name_prefix='ollama-hedge')
+
+    def pick(self, exclude=()):
+        """
+        Least in-flight healthy endpoint; ties go to the lower observed latency, and
+        hosts that have never answered rank after every host that has
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude and e.available(now)]
+            if not candidates:
+                # Everything is ejected; try whichever host comes back soonest rather than fail outright
+                candidates = sorted(
+                    (e for e in self.endpoints if e not in exclude and not e.probing),
+                    key=lambda e: e.open_until
+                )[:1]
+            if not candidates:
+                raise NoHealthyEndpoint('No Ollama endpoint available')
+            endpoint = min(candidates, key=lambda e: (e.in_flight, e.latency is None, e.latency or 0.0))
+            endpoint.admit(now)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def release(self, endpoint: OllamaEndpoint):
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def call(self, fn, deadline: float, retries: int = 1, exclude=(), retry_on_timeout: bool = True):
+        """
+        Run fn(client) on the best endpoint within the deadline. Failures count
+        towards the host's circuit breaker and are retried on another host, all
+        within the same overall deadline. With retry_on_timeout=False a read
+        timeout is final: a generation that ran out of time is not started again.
+        """
+        import httpx
+
+        end = time.time() + deadline
+        tried = list(exclude)
+        last_error = None
+        for attempt in range(retries + 1):
+            # Whole seconds keep the per-deadline client cache small
+            remaining = deadline if attempt == 0 else int(end - time.time())
+            if remaining < 1:
+                break
+            try:
+                endpoint = self.pick(exclude=tried)
+            except NoHealthyEndpoint:
+                break
+            tried.append(endpoint)
+            start = time.time()
+            try:
+                result = fn(endpoint.client(remaining))
+                endpoint.record_success(time.time() - start)
+                return result
+            except Exception as e:
+                last_error = e
+                endpoint.record_failure()
+                logger.warning(f'Ollama call to {endpoint.host} failed : {e}')
+                if isinstance(e, httpx.ReadTimeout) and not retry_on_timeout:
+                    break
+            finally:
+                self.release(endpoint)
+        raise last_error or NoHealthyEndpoint('No Ollama endpoint available')
+
+    def hedged_call(self, fn, deadline: float, hedge_after: float = None):
+        """
+        Send fn to one host and, if it has not answered after hedge_after seconds,
+        send a duplicate to another host. The first successful answer wins; only
+        use this for idempotent requests such as embeddings.
+        """
+        hedge_after = hedge_after if hedge_after is not None else ollama_settings['hedge_after']
+        if len(self.endpoints) < 2:
+            return self.call(fn, deadline)
+
+        primary = self._hedge_executor.submit(self.call, fn, deadline, 0)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        # The primary still counts as in flight, so the hedge lands on another host
+        futures = [primary]
+        try:
+            futures.append(self._hedge_executor.submit(self.call, fn, deadline, 0))
+        except RuntimeError:
+            pass
+
+        end = time.time() + deadline
+        errors = []
+        while futures:
+            done, pending = wait(futures, timeout=max(0.0, end - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+            futures = list(pending)
+        if errors:
+            raise errors[-1]
+        raise TimeoutError(f'Hedged Ollama call exceeded {deadline}s deadline')
+
+    def stats(self):
+        return [e.snapshot() for e in self.endpoints]
+
+
+_ollama_pool = None
+_ollama_pool_lock = threading.Lock()
+
+def get_ollama_pool():
+    global _ollama_pool
+    if _ollama_pool is None:
+        with _ollama_pool_lock:
+            if _ollama_pool is None:
+                _ollama_pool = OllamaPool()
+    return _ollama_pool
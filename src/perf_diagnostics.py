@@ -2,8 +2,10 @@ import time
 import functools
 from typing import Callable, Any
 import logging
+import os
+import subprocess
+import sys
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def time_function(func_name : str = None):
@@ -85,6 +87,300 @@ def quick_benchmark(questions: list, chain, retriever, iterations: int = 1):
 
     print(f'\nOverall Average : {sum(total_times)/len(total_times):.2f}s')
 
+def measure_import_time(module: str):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Returns (cumulative seconds, [(seconds, package), ...] heaviest first).
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=src_dir, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed : {proc.stderr.strip().splitlines()[-1]}')
+
+    total = 0.0
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, package = line.split('|')
+        try:
+            seconds = int(cumulative.strip()) / 1e6
+        except ValueError:
+            continue  # header line
+        entries.append((seconds, package.strip()))
+        if package.strip() == module:
+            total = seconds
+
+    entries.sort(reverse=True)
+    return total, entries
+
+def check_startup_budget(modules: list = None, budget: float = None):
+    """Fail if any entry-point module takes longer than the budget to import"""
+    from config import startup_settings
+    modules = modules or startup_settings['modules']
+    budget = budget or startup_settings['import_budget']
+
+    print('\n Import Time Budget')
+    print('-' * 50)
+
+    within_budget = True
+    for module in modules:
+        try:
+            total, entries = measure_import_time(module)
+        except RuntimeError as e:
+            print(f' {module:<20} [FAILED] {e}')
+            within_budget = False
+            continue
+        status = 'OK' if total <= budget else 'OVER'
+        print(f' {module:<20} {total:.3f}s  [{status}]')
+        if total > budget:
+            within_budget = False
+            for seconds, package in entries[1:6]:
+                print(f'    {seconds:.3f}s  {package}')
+
+    print(f'\nBudget : {budget:.2f}s per module')
+    return within_budget
+
+def stress_session_state(workers: int = 32, sessions: int = 64, turns: int = 50):
+    """
+    Hammer the shared state the Gradio workers touch from many threads: the
+    singletons, the agent's model/chain caches, the prefetcher, admission slots
+    and the conversation store. Each turn runs the genie_chat flow (prefetch
+    take, handle_question, history record) with a stub chain and retriever, so
+    no Ollama host is needed. When the review summary exists, turns also go
+    through handle_conversation on its analytics route.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from langchain_core.documents import Document
+    from admission import get_admission_controller
+    from analytics import get_summary
+    from config import conversation_settings, genie_template, models
+    from conversation import get_conversation_store
+    from prefetch import RetrievalPrefetcher
+    from rag_agent import get_rag_agent, handle_question, handle_conversation
+    from vector_config import get_embeddings
+
+    print(f'\n Session State Stress : {workers} threads, {sessions} sessions, {turns} turns')
+    print('-' * 50)
+    for name in ('rag_agent', 'prefetch', 'admission'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    class StubRetriever:
+        def invoke(self, text):
+            return [Document(page_content=text, metadata={'query': text})]
+
+    class StubChain:
+        def invoke(self, inputs):
+            return inputs['question']
+
+    # An aggregate question is answered from the summary, so no Ollama call is made
+    converse = get_summary() is not None
+    if not converse:
+        print('No review summary available, handle_conversation turns skipped')
+
+    templates = [f'{genie_template}\n' + ' ' * k for k in range(4)]
+    prefetcher = RetrievalPrefetcher(StubRetriever(), debounce=0.0)
+    chain, retriever = StubChain(), StubRetriever()
+    barrier = threading.Barrier(workers)
+
+    def worker(n):
+        barrier.wait()
+        seen = (id(get_conversation_store()), id(get_rag_agent()), id(get_embeddings()), id(get_admission_controller()))
+        chains, errors = {}, []
+        for turn in range(turns):
+            session_id = f'stress-{(n + turn) % sessions}'
+            question = f'{session_id} turn {turn} from worker {n}?'
+
+            key = turn % len(templates)
+            chains.setdefault(key, set()).add(id(get_rag_agent().create_chain(models['llama1b'], templates[key])))
+
+            prefetcher.schedule(session_id, question)
+            docs = prefetcher.take(session_id, question, timeout=5)
+            if docs and docs[0].metadata['query'] != question:
+                errors.append(f'prefetch for {question!r} returned docs for {docs[0].metadata["query"]!r}')
+
+            answer = handle_question(chain, retriever, question, relevant_docs=[], priority='interactive')
+            if answer != question and not answer.startswith('The genie is busy'):
+                errors.append(f'handle_question answered {answer!r} to {question!r}')
+
+            if converse:
+                summary_answer, stats = handle_conversation(models['llama1b'], None, 'How many reviews are there?', session_id)
+                if stats.get('route') != 'analytics':
+                    errors.append(f'handle_conversation : {summary_answer}')
+
+            get_conversation_store().get(session_id).record({'question': question, 'answer': answer})
+        return seen, chains, errors[:1]
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(worker, range(workers)))
+    elapsed = time.time() - start
+    prefetcher.shutdown()
+
+    store = get_conversation_store()
+    seen = {result[0] for result in results}
+    chains = {}
+    for _, built, _ in results:
+        for key, ids in built.items():
+            chains.setdefault(key, set()).update(ids)
+    errors = [error for result in results for error in result[2]]
+    admission = get_admission_controller().stats()
+
+    failures = []
+    if len(seen) != 1:
+        failures.append(f'singletons built {len(seen)} times')
+    if any(len(ids) != 1 for ids in chains.values()):
+        failures.append(f'chains built more than once : { {key: len(ids) for key, ids in chains.items()} }')
+    if errors:
+        failures.append(errors[0])
+    if admission['in_use'] or admission['queue_depth']:
+        failures.append(f"admission slots leaked : {admission['in_use']} in use, {admission['queue_depth']} queued")
+    if len(store) > store.max_sessions:
+        failures.append(f'store holds {len(store)} sessions, limit {store.max_sessions}')
+    for i in range(sessions):
+        session_id = f'stress-{i}'
+        history = store.get(session_id).history
+        if len(history) > conversation_settings['history_size']:
+            failures.append(f'{session_id} history unbounded ({len(history)})')
+        leaked = [h for h in history if not h['question'].startswith(f'{session_id} ')]
+        if leaked:
+            failures.append(f'{session_id} holds entries from other sessions : {leaked[:2]}')
+        store.drop(session_id)
+
+    print(f'Completed in {elapsed:.2f}s | prefetch {prefetcher.stats} | admission rejected {admission["rejected"]}')
+    for failure in failures:
+        print(f' FAIL : {failure}')
+    print('Result :', 'OK' if not failures else 'FAILED')
+    return not failures
+
+def check_ollama_pool():
+    """
+    Run the pool against local stub Ollama servers and check load balancing,
+    the circuit breaker's single half-open probe, deadlines and hedging.
+    No real Ollama host is needed.
+    """
+    import json
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from ollama_pool import OllamaPool
+
+    print('\n Ollama Pool Check')
+    print('-' * 50)
+
+    class StubOllama(BaseHTTPRequestHandler):
+        # server.mode: 'ok', 'fail' (HTTP 500) or a float delay in seconds before answering
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self.server.hits += 1
+            mode = self.server.mode
+            if mode == 'fail':
+                self.send_response(500)
+                self.end_headers()
+                return
+            if isinstance(mode, float):
+                time.sleep(mode)
+            if self.path == '/api/embed':
+                body = {'model': 'stub', 'embeddings': [[0.1, 0.2]]}
+            else:
+                body = {'model': 'stub', 'response': 'ok', 'done': True}
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class StubServer(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            pass  # clients that hit their deadline hang up mid-response
+
+    servers = []
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    def stub(mode):
+        server = StubServer(('127.0.0.1', 0), StubOllama)
+        server.mode = mode
+        server.hits = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    def url(server):
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    generate = lambda client: client.generate(model='stub', prompt='hi')
+    embed = lambda client: client.embed(model='stub', input=['hi'])
+    failures = []
+
+    try:
+        # A host that has never answered must not outrank one with a known latency
+        failing, healthy = stub('fail'), stub('ok')
+        pool = OllamaPool([url(failing), url(healthy)], failure_threshold=100)
+        for _ in range(20):
+            pool.call(generate, deadline=5)
+        if failing.hits > 1:
+            failures.append(f'failing host picked {failing.hits} times out of 20')
+        print(f' ranking      : failing host tried {failing.hits}x, healthy {healthy.hits}x')
+
+        # After the cooldown exactly one trial request reaches the recovering host
+        recovering, healthy = stub('fail'), stub('ok')
+        pool = OllamaPool([url(recovering), url(healthy)], failure_threshold=1, cooldown=0.5)
+        pool.call(generate, deadline=5)
+        pool.call(generate, deadline=5)
+        recovering.mode, recovering.hits = 0.3, 0
+        time.sleep(0.6)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: pool.call(generate, deadline=5), range(8)))
+        if recovering.hits != 1:
+            failures.append(f'half-open host got {recovering.hits} requests, expected 1 probe')
+        if pool.endpoints[0].open_until:
+            failures.append('breaker still open after a successful probe')
+        print(f' half-open    : recovering host got {recovering.hits} of 8 concurrent requests')
+
+        # A generation that times out is neither retried nor allowed past its deadline
+        slow_a, slow_b = stub(3.0), stub(3.0)
+        pool = OllamaPool([url(slow_a), url(slow_b)], failure_threshold=100)
+        for retry_on_timeout in (False, True):
+            start = time.time()
+            try:
+                pool.call(generate, deadline=1, retry_on_timeout=retry_on_timeout)
+                failures.append('call to a stalled host did not time out')
+            except Exception:
+                pass
+            elapsed = time.time() - start
+            if elapsed > 1.5:
+                failures.append(f'deadline 1s took {elapsed:.2f}s (retry_on_timeout={retry_on_timeout})')
+            print(f' deadline     : 1s deadline ended after {elapsed:.2f}s (retry_on_timeout={retry_on_timeout})')
+
+        # A hedged embedding is answered by the fast host while the slow one stalls
+        slow, fast = stub(2.0), stub('ok')
+        pool = OllamaPool([url(slow), url(fast)], failure_threshold=100)
+        pool.endpoints[0].latency = 0.001   # make the slow host the primary
+        start = time.time()
+        pool.hedged_call(embed, deadline=5, hedge_after=0.1)
+        elapsed = time.time() - start
+        if elapsed > 1.0:
+            failures.append(f'hedged call took {elapsed:.2f}s')
+        print(f' hedging      : answered in {elapsed:.2f}s with a 2s primary')
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    for failure in failures:
+        print(f' FAIL : {failure}')
+    print('Result :', 'OK' if not failures else 'FAILED')
+    return not failures
+
 Test_questions = [
     "What are the best pizza places?",
     "Show me restaurants with 5-star ratings",
@@ -94,6 +390,17 @@ Test_questions = [
 ]
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+    if '--startup' in sys.argv:
+        sys.exit(0 if check_startup_budget() else 1)
+
+    if '--stress' in sys.argv:
+        sys.exit(0 if stress_session_state() else 1)
+
+    if '--pool' in sys.argv:
+        sys.exit(0 if check_ollama_pool() else 1)
+
     from vector_config import create_vectorstore
     from rag_agent import create_chain
     from config import models, genie_template
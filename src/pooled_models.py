@@ -0,0 +1,81 @@
+# pooled_models.py
+# LangChain wrappers that route generation and embedding calls through the shared OllamaPool
+from collections import OrderedDict
+from typing import Any, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from ollama_pool import get_ollama_pool
+from config import ollama_settings
+import threading
+
+
+class PooledOllamaLLM(LLM):
+    """Drop-in for OllamaLLM: load-balanced across hosts with a per-request deadline"""
+
+    model: str
+    options: dict = {}
+    keep_alive: Optional[str] = None
+    deadline: float = ollama_settings['generate_deadline']
+
+    @property
+    def _llm_type(self) -> str:
+        return 'pooled-ollama'
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        options = dict(self.options)
+        if stop:
+            options['stop'] = stop
+
+        response = get_ollama_pool().call(
+            lambda client: client.generate(
+                model=self.model, prompt=prompt, options=options, keep_alive=self.keep_alive
+            ),
+            deadline=self.deadline,
+            retry_on_timeout=False
+        )
+        return response['response']
+
+
+class PooledOllamaEmbeddings(Embeddings):
+    """Drop-in for OllamaEmbeddings; query embeddings are hedged to cut tail latency"""
+
+    def __init__(self, model: str, deadline: float = None):
+        self.model = model
+        self.deadline = deadline or ollama_settings['embed_deadline']
+        # The retriever and the context compressor embed the same question back to back
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    def _embed(self, texts: List[str], hedge: bool, deadline: float = None):
+        pool = get_ollama_pool()
+        deadline = deadline or self.deadline
+        fn = lambda client: client.embed(model=self.model, input=texts)
+        if hedge:
+            response = pool.hedged_call(fn, deadline=deadline)
+        else:
+            response = pool.call(fn, deadline=deadline)
+        return [list(vector) for vector in response['embeddings']]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Ingestion batches are large and not latency sensitive, so they are not duplicated.
+        # Bounded sub-batches, each with a deadline scaled to the batch size (one client per size)
+        batch_size = ollama_settings['embed_batch_size']
+        deadline = self.deadline + ollama_settings['embed_deadline_per_text'] * batch_size
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(self._embed(texts[i:i + batch_size], hedge=False, deadline=deadline))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._query_lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                return vector
+
+        vector = self._embed([text], hedge=True)[0]
+        with self._query_lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > ollama_settings['query_cache_size']:
+                self._query_cache.popitem(last=False)
+        return vector
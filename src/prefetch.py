@@ -0,0 +1,141 @@
+# prefetch.py
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import prefetch_settings
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    text = re.sub(r'\s+', ' ', text or '').strip().lower()
+    return text.rstrip('?!. ')
+
+
+class _PrefetchEntry:
+    def __init__(self, text: str):
+        self.text = text
+        self.key = normalize_query(text)
+        self.timer = None
+        self.future = None
+        self.created = time.time()
+
+
+class RetrievalPrefetcher:
+    """
+    Speculatively runs retrieval for a partially typed question.
+
+    Each keystroke restarts a debounce timer for the session; when the user pauses,
+    the question is embedded and retrieved on a worker thread and the result is
+    kept per session. On submit, `take` hands back the cached documents if the
+    final question is what was prefetched, or only finishes its last word.
+    """
+
+    def __init__(self, retriever, debounce: float = None, max_sessions: int = None):
+        self.retriever = retriever
+        self.debounce = debounce if debounce is not None else prefetch_settings['debounce']
+        self.max_sessions = max_sessions or prefetch_settings['max_sessions']
+        self._executor = ThreadPoolExecutor(max_workers=prefetch_settings['workers'], thread_name_prefix='prefetch')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'started': 0, 'hits': 0, 'misses': 0, 'cancelled': 0}
+
+    def schedule(self, session_id: str, text: str):
+        """Called on every change of the question box"""
+        if len(normalize_query(text)) < prefetch_settings['min_chars']:
+            self.cancel(session_id)
+            return
+
+        with self._lock:
+            current = self._entries.get(session_id)
+            if current is not None and current.key == normalize_query(text):
+                return
+            self._cancel_entry(current)
+
+            entry = _PrefetchEntry(text)
+            entry.timer = threading.Timer(self.debounce, self._start, args=(session_id, entry))
+            entry.timer.daemon = True
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                _, evicted = self._entries.popitem(last=False)
+                self._cancel_entry(evicted)
+
+        entry.timer.start()
+
+    def take(self, session_id: str, question: str, timeout: float = None):
+        """
+        Return prefetched documents for the submitted question, or None if there is
+        no usable prefetch. A matching retrieval still in flight is waited on since
+        it is already ahead of a fresh one.
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+
+        if entry is None:
+            self._count('misses')
+            return None
+
+        if not self._is_same_query(entry.key, normalize_query(question)):
+            self._cancel_entry(entry)
+            self._count('misses')
+            return None
+
+        if entry.future is None:
+            # Still inside the debounce window, nothing has been computed yet
+            self._cancel_entry(entry)
+            self._count('misses')
+            return None
+
+        try:
+            docs = entry.future.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f'Prefetch for session {session_id} unusable : {e}')
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        logger.info(f'Prefetch hit for session {session_id} ({time.time() - entry.created:.2f}s since typed)')
+        return docs
+
+    def cancel(self, session_id: str):
+        with self._lock:
+            self._cancel_entry(self._entries.pop(session_id, None))
+
+    def shutdown(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._cancel_entry(entry)
+            self._entries.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self, session_id: str, entry: _PrefetchEntry):
+        with self._lock:
+            if self._entries.get(session_id) is not entry:
+                return
+            entry.future = self._executor.submit(self.retriever.invoke, entry.text)
+        self._count('started')
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _cancel_entry(self, entry):
+        if entry is None:
+            return
+        if entry.timer is not None:
+            entry.timer.cancel()
+        if entry.future is not None and entry.future.cancel():
+            self._count('cancelled')
+
+    @staticmethod
+    def _is_same_query(prefetched: str, submitted: str) -> bool:
+        # Text similarity is not meaning ("best" vs "worst", "good" vs "not good"),
+        # so only reuse when the submit just completes the word being typed
+        if prefetched == submitted:
+            return True
+        return submitted.startswith(prefetched) and not any(c.isspace() for c in submitted[len(prefetched):])
@@ -1,77 +1,258 @@
 #rag_agent.py
-from langchain_ollama.llms import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
-from config import model_settings
+from config import model_settings, genie_template, genie_system_prompt, genie_turn_template, conversation_settings, ollama_settings, analytics_settings, compression_settings
+from analytics import answer_aggregate
+from compression import get_compressor
+from admission import AdmissionRejected, get_admission_controller
+from conversation import get_conversation_store
+from ollama_pool import get_ollama_pool
+import threading
 import time
 import logging
 
-logging.basicConfig(level = logging.INFO)
 logger = logging.getLogger(__name__)
 
+class StripedCache:
+    """
+    Dict cache split across independently locked stripes, so building one
+    entry (e.g. a model client) only blocks callers that hash to the same stripe.
+    """
+
+    def __init__(self, stripes: int = 8):
+        self._stripes = [({}, threading.Lock()) for _ in range(stripes)]
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get_or_create(self, key, factory):
+        data, lock = self._stripe(key)
+        value = data.get(key)
+        if value is None:
+            with lock:
+                value = data.get(key)
+                if value is None:
+                    value = factory()
+                    data[key] = value
+        return value
+
+    def __contains__(self, key):
+        data, _ = self._stripe(key)
+        return key in data
+
+    def __len__(self):
+        return sum(len(data) for data, _ in self._stripes)
+
+
+def _require_client(client_id: str, priority: str):
+    # Batch/API traffic is the class that most needs the rate limit
+    if priority == 'batch' and not client_id:
+        raise ValueError('Batch requests need a client_id for rate limiting')
+
+
 class OptimizedRagAgent:
     """
     Optimized RAG Agent with connection 
     """
 
     def __init__(self):
-        self._model_cache = {}
-        self._chain_cache = {}
+        self._model_cache = StripedCache()
+        self._chain_cache = StripedCache()
 
     def get_model(self, model_name: str):
 
-        if model_name not in self._model_cache:
+        def build():
+            from pooled_models import PooledOllamaLLM
             logger.info(f'\nInitiazling model : {model_name}')
-            self._model_cache[model_name] = OllamaLLM(
+            return PooledOllamaLLM(
                 model = model_name,
-                temperature = model_settings['temperature'],
-                top_p = model_settings['top_p'],
-                repeat_penalty = model_settings['repeat_penalty']
+                options = {
+                    'temperature' : model_settings['temperature'],
+                    'top_p' : model_settings['top_p'],
+                    'repeat_penalty' : model_settings['repeat_penalty']
+                }
             )
-        return self._model_cache[model_name]
+
+        return self._model_cache.get_or_create(model_name, build)
     
     def create_chain(self, model_name:str, prompt_template:str):
         cache_key = f'{model_name}_{hash(prompt_template)}'
 
-        if cache_key not in self._chain_cache:
+        def build():
+            from langchain_core.prompts import ChatPromptTemplate
             logger.info(f'Creating new chain for {model_name}')
             model = self.get_model(model_name)
             prompt = ChatPromptTemplate.from_template(prompt_template)
-            self._chain_cache[cache_key] = prompt | model
+            return prompt | model
 
-        return self._chain_cache[cache_key]
+        return self._chain_cache.get_or_create(cache_key, build)
     
-    def handle_question(self, chain, retriever, question:str):
+    def handle_question(self, chain, retriever, question:str, relevant_docs=None, client_id:str=None, priority:str='batch'):
+        """
+        `client_id` keys the per-client rate limit (a client address or API key,
+        not a UI session that changes on reload); batch callers must supply one.
+        """
+        _require_client(client_id, priority)
 
         try:
             start_time = time.time()
 
+            # Rankings and aggregates come from the full-corpus summary, not 3 reviews
+            facts = answer_aggregate(question)
+            if facts is not None:
+                logger.info(f'Analytics fast path : {time.time() - start_time:.3f}s')
+                if not analytics_settings['phrase_with_llm']:
+                    return facts
+                with get_admission_controller().slot(client_id, priority):
+                    return chain.invoke({'reviews' : facts, 'question' : question})
+
             retrieval_start = time.time()
-            relevant_docs = retriever.invoke(question) # calls the retriever
+            if relevant_docs is None:
+                relevant_docs = retriever.invoke(question) # calls the retriever
             retrieval_time = time.time() - retrieval_start
 
             context_start = time.time()
-            if relevant_docs:
-                # Limit context length for faster processing
-                context = self._prepare_context(relevant_docs, max_length=1500)
-            else:
-                context = "No relevant reviews found."
+            context, compression = self._build_context(question, relevant_docs)
             context_time = time.time() - context_start
 
             generation_start = time.time()
-            result = chain.invoke({
-                'reviews' : context,
-                'question' : question
-            })
+            with get_admission_controller().slot(client_id, priority):
+                result = chain.invoke({
+                    'reviews' : context,
+                    'question' : question
+                })
             generation_time = time.time() - generation_start
 
             total_time = time.time() - start_time
             logger.info(f'Retrieval : {retrieval_time:.2f}s | Context: {context_time:.2f}s | Generation : {generation_time:.2f}s')
+            if compression:
+                logger.info(f"Compression : {compression['ratio']:.0%} of {compression['original_chars']} chars | {compression['saved_seconds']:+.2f}s net prompt eval saved")
 
             return result
+        except AdmissionRejected as e:
+            logger.warning(f'Question not admitted : {e}')
+            return f'The genie is busy granting other wishes. Please try again in {e.retry_after:.0f}s.'
         except Exception as e:
             logger.error(f'Error handling question : {e}')
             return f'Sorry, I encountered an error : {str(e)}'
         
+    def handle_conversation(self, model_name: str, retriever, question: str, session_id: str, relevant_docs=None, priority: str = 'interactive', client_id: str = None):
+        """
+        Answer a question as one turn of a session. The persona is sent as the system
+        prompt only on the turn that starts a context; after that Ollama's returned
+        context (which already holds it) is fed back, so follow-ups only
+        prompt-evaluate their new reviews and question. The rate limit is keyed
+        on `client_id`, not on the session.
+        Returns (answer, stats).
+        """
+        _require_client(client_id, priority)
+        session = get_conversation_store().get(session_id)
+
+        try:
+            start_time = time.time()
+
+            facts = answer_aggregate(question)
+            if facts is not None:
+                logger.info(f'Session {session_id} | Analytics fast path : {time.time() - start_time:.3f}s')
+                session.last_stats = {}
+                if analytics_settings['phrase_with_llm']:
+                    chain = self.create_chain(model_name, genie_template)
+                    with get_admission_controller().slot(client_id, priority):
+                        facts = chain.invoke({'reviews' : facts, 'question' : question})
+                # Not part of the Ollama context; the next generated turn gets it as text
+                with session.lock:
+                    session.add_turn(question, facts, in_context=False)
+                return facts, {'route' : 'analytics', 'total_time' : time.time() - start_time}
+
+            retrieval_start = time.time()
+            if relevant_docs is None:
+                relevant_docs = retriever.invoke(question)
+            retrieval_time = time.time() - retrieval_start
+
+            context, compression = self._build_context(question, relevant_docs)
+
+            # One turn at a time per session so the Ollama context is never raced
+            with session.lock, get_admission_controller().slot(client_id, priority):
+                if session.needs_reset():
+                    logger.info(f'Session {session_id} context at {session.context_tokens()} tokens, summarizing')
+                    session.reset_context()
+
+                prompt = genie_turn_template.format(reviews=context, question=question)
+                history = session.history_prompt()
+                if history:
+                    prompt = f'Conversation so far:\n{history}\n{prompt}'
+
+                # A system prompt on a continued context would be appended to it again
+                system = genie_system_prompt if session.context is None else None
+
+                generation_start = time.time()
+                response = get_ollama_pool().call(
+                    lambda client: client.generate(
+                        model = model_name,
+                        prompt = prompt,
+                        system = system,
+                        context = session.context,
+                        keep_alive = conversation_settings['keep_alive'],
+                        options = {
+                            'temperature' : model_settings['temperature'],
+                            'top_p' : model_settings['top_p'],
+                            'repeat_penalty' : model_settings['repeat_penalty'],
+                            'num_ctx' : conversation_settings['num_ctx']
+                        }
+                    ),
+                    deadline = ollama_settings['generate_deadline'],
+                    retry_on_timeout = False
+                )
+                generation_time = time.time() - generation_start
+
+                result = response['response']
+                session.add_turn(question, result, response.get('context'))
+
+                stats = {
+                    'turn' : session.turn_count,
+                    'retrieval_time' : retrieval_time,
+                    'generation_time' : generation_time,
+                    'prompt_eval_count' : response.get('prompt_eval_count') or 0,
+                    'prompt_eval_time' : (response.get('prompt_eval_duration') or 0) / 1e9,
+                    'context_tokens' : session.context_tokens(),
+                    'compression_ratio' : compression['ratio'] if compression else 1.0,
+                    'compression_saved' : compression['saved_seconds'] if compression else 0.0,
+                    'total_time' : time.time() - start_time
+                }
+                session.last_stats = stats
+                get_compressor().observe_prompt_eval(stats['prompt_eval_count'], stats['prompt_eval_time'])
+            logger.info(f"Session {session_id} | Retrieval : {retrieval_time:.2f}s | Prompt eval : {stats['prompt_eval_count']} tokens in {stats['prompt_eval_time']:.2f}s | Generation : {generation_time:.2f}s")
+
+            return result, stats
+        except AdmissionRejected as e:
+            logger.warning(f'Session {session_id} not admitted : {e}')
+            session.last_stats = {}
+            return f'The genie is busy granting other wishes. Please try again in {e.retry_after:.0f}s.', {}
+        except Exception as e:
+            logger.error(f'Error handling conversation turn : {e}')
+            session.last_stats = {}
+            return f'Sorry, I encountered an error : {str(e)}', {}
+
+    def _build_context(self, question: str, docs):
+        """
+        Prompt context for the retrieved docs. With compression enabled only the
+        sentences closest to the question are kept; returns (context, report or None).
+        """
+        if not docs:
+            return "No relevant reviews found.", None
+
+        # Limit context length for faster processing
+        context = self._prepare_context(docs, max_length=1500)
+        if not compression_settings['enabled']:
+            return context, None
+
+        try:
+            compressed, report = get_compressor().compress(question, docs, baseline_chars=len(context))
+        except Exception as e:
+            logger.warning(f'Context compression failed, sending full reviews : {e}')
+            return context, None
+        if not compressed:
+            return context, None
+        return compressed, report
+
     def _prepare_context(self, docs, max_length: int = 1500):
         context_parts = []
         current_length = 0
@@ -95,21 +276,27 @@ class OptimizedRagAgent:
         return '\n\n'.join(context_parts)
     
 _rag_agent_instance = None
+_rag_agent_lock = threading.Lock()
 
 def get_rag_agent():
     global _rag_agent_instance
     if _rag_agent_instance is None:
-        _rag_agent_instance = OptimizedRagAgent()
+        with _rag_agent_lock:
+            if _rag_agent_instance is None:
+                _rag_agent_instance = OptimizedRagAgent()
     return _rag_agent_instance
 
 def create_chain(model_name:str, prompt_template:str):
     agent = get_rag_agent()
     return agent.create_chain(model_name, prompt_template)
 
-def handle_question(chain, retriever, question:str):
+def handle_question(chain, retriever, question:str, relevant_docs=None, client_id:str=None, priority:str='batch'):
     agent = get_rag_agent()
-    return agent.handle_question(chain, retriever, question)
-
-
+    return agent.handle_question(chain, retriever, question, relevant_docs, client_id, priority)
 
+def handle_conversation(model_name: str, retriever, question: str, session_id: str, relevant_docs=None, priority: str = 'interactive', client_id: str = None):
+    agent = get_rag_agent()
+    return agent.handle_conversation(model_name, retriever, question, session_id, relevant_docs, priority, client_id)
 
+def clear_conversation(session_id: str):
+    get_conversation_store().drop(session_id)
@@ -0,0 +1,39 @@
+# shard_worker.py
+"""
+Entry point of the shard serving processes.
+
+Kept apart from sharding.py so the forkserver only has to preload this module
+and snapshot/numpy, not the coordinator or the app.
+"""
+from snapshot import IndexSnapshot
+import numpy as np
+
+
+def serve_shard(shard_id: int, path: str, requests, responses):
+    """
+    Serving loop of one shard process. Answers (request_id, query_vector, fetch_k)
+    with (request_id, scores, rows): only the shard-local top fetch_k scores and
+    row numbers cross the pipe, the coordinator reads the rows from its own map.
+    """
+    snapshot = IndexSnapshot(path)
+    vectors = snapshot.vectors
+    responses.send(('ready', len(snapshot)))
+
+    while True:
+        try:
+            message = requests.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, query_vector, fetch_k = message
+        try:
+            if len(vectors) == 0:
+                responses.send((request_id, np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)))
+                continue
+            scores = vectors @ query_vector
+            fetch_k = min(fetch_k, len(scores))
+            rows = np.argpartition(-scores, fetch_k - 1)[:fetch_k]
+            responses.send((request_id, scores[rows], rows))
+        except Exception as e:
+            responses.send((request_id, e, None))
@@ -0,0 +1,408 @@
+# sharding.py
+"""
+Sharded review index with multi-process scatter-gather search.
+
+Documents are partitioned by a stable hash of their id into N shards. Each shard
+is built in its own process (embedding its partition and writing a snapshot
+file), and at serving time each shard is owned by a worker process that keeps
+its snapshot memory-mapped. The coordinator embeds the query once, fans the
+vector out to every worker, merges the per-shard top fetch_k and runs MMR on
+the merged candidates.
+
+Every query pays an inter-process round trip per shard, so sharding only pays
+off once scanning a shard costs more than that (large corpora, several cores);
+`bench` measures where that point is on a given machine.
+
+Usage:
+    python src/sharding.py build [num_shards]
+    python src/sharding.py bench [num_docs] [dim]     # throughput over shard counts
+"""
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from config import CSV_FILE, EMBEDDING_MODEL, retrival_settings, sharding_settings
+from shard_worker import serve_shard
+import multiprocessing as mp
+import numpy as np
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST = 'shards.json'
+
+
+def shard_for(doc_id: str, num_shards: int) -> int:
+    return zlib.crc32(str(doc_id).encode('utf-8')) % num_shards
+
+
+def shard_path(shard_dir: str, shard_id: int) -> str:
+    return os.path.join(shard_dir, f'shard-{shard_id:03d}.ragsnap')
+
+
+def _build_shard(shard_id: int, path: str, ids, texts, metadatas):
+    """Runs in a worker process: embed one partition and write its snapshot"""
+    from vector_config import get_embeddings
+    from snapshot import write_snapshot
+
+    start_time = time.time()
+    embeddings = get_embeddings().embed_documents(texts) if texts else []
+    write_snapshot(path, ids, texts, metadatas, embeddings)
+    return shard_id, len(ids), time.time() - start_time
+
+
+def build_shards(documents, ids, num_shards: int = None, shard_dir: str = None):
+    """Partition documents and build every shard in parallel"""
+    # More shards than documents would only produce empty shards and idle workers
+    num_shards = max(1, min(num_shards or sharding_settings['num_shards'], len(ids)))
+    shard_dir = shard_dir or sharding_settings['dir']
+    os.makedirs(shard_dir, exist_ok=True)
+
+    partitions = [([], [], []) for _ in range(num_shards)]
+    for doc, doc_id in zip(documents, ids):
+        part = partitions[shard_for(doc_id, num_shards)]
+        part[0].append(doc_id)
+        part[1].append(doc.page_content)
+        part[2].append(doc.metadata)
+
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=min(num_shards, os.cpu_count() or 1), mp_context=_worker_context()) as pool:
+        futures = [
+            pool.submit(_build_shard, i, shard_path(shard_dir, i), *partitions[i])
+            for i in range(num_shards)
+        ]
+        for future in futures:
+            shard_id, count, elapsed = future.result()
+            logger.info(f'Shard {shard_id}: {count} documents in {elapsed:.2f}s')
+
+    with open(os.path.join(shard_dir, _MANIFEST), 'w') as f:
+        json.dump({'num_shards': num_shards, 'embedding_model': EMBEDDING_MODEL, 'count': len(ids)}, f)
+
+    logger.info(f'Built {num_shards} shards ({len(ids)} documents) in {time.time() - start_time:.2f}s')
+
+
+def build_shards_from_csv(csv_path: str = CSV_FILE, num_shards: int = None, shard_dir: str = None):
+    """Ingestion path for sharded serving: load, fold near-duplicates, build shards in parallel"""
+    from vector_config import load_data_from_csv
+    from dedup import SignatureIndex
+
+    documents, ids = load_data_from_csv(csv_path)
+    if not documents:
+        raise ValueError(f'No documents loaded from {csv_path}')
+    documents, ids, _ = SignatureIndex().deduplicate(documents, ids)
+    build_shards(documents, ids, num_shards, shard_dir)
+
+
+class ShardWorkerError(RuntimeError):
+    """A shard serving process exited"""
+
+
+def _worker_context():
+    """
+    Multiprocessing context for shard processes. forkserver avoids fork() of a
+    process that already runs threads, and its server preloads only
+    shard_worker; platforms without forkserver fall back to spawn.
+    """
+    method = sharding_settings['start_method']
+    if method == 'forkserver' and 'forkserver' not in mp.get_all_start_methods():
+        method = 'spawn'
+    ctx = mp.get_context(method)
+    if method == 'forkserver':
+        ctx.set_forkserver_preload(['shard_worker'])
+    return ctx
+
+
+class ShardedIndex:
+    """
+    Coordinator that owns one worker process per shard. Each worker has its own
+    request and response pipe, and workers only return scores and row numbers;
+    the coordinator maps the same snapshot files (shared page cache) to read
+    vectors, text and metadata for the merged top fetch_k.
+    """
+
+    def __init__(self, shard_dir: str = None, start_timeout: float = 60):
+        from snapshot import IndexSnapshot
+
+        self.shard_dir = shard_dir or sharding_settings['dir']
+        with open(os.path.join(self.shard_dir, _MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['embedding_model'] != EMBEDDING_MODEL:
+            raise ValueError(f"Shards built with {self.manifest['embedding_model']}, not {EMBEDDING_MODEL}")
+
+        self.num_shards = self.manifest['num_shards']
+        self.start_timeout = start_timeout
+        self.snapshots = [IndexSnapshot(shard_path(self.shard_dir, i)) for i in range(self.num_shards)]
+        self._requests = []      # (connection, send lock) per shard
+        self._responses = []
+        self._workers = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _ensure_started(self):
+        """
+        Workers are started on the first search, not at construction: the app
+        builds its retriever at startup, and spawned/forkserver children
+        re-import the app's __main__, which must not start processes itself.
+        """
+        if self._workers:
+            return
+        with self._start_lock:
+            if self._workers:
+                return
+            ctx = _worker_context()
+            workers, requests, responses = [], [], []
+            for i in range(self.num_shards):
+                request_recv, request_send = ctx.Pipe(duplex=False)
+                response_recv, response_send = ctx.Pipe(duplex=False)
+                worker = ctx.Process(
+                    target=serve_shard,
+                    args=(i, shard_path(self.shard_dir, i), request_recv, response_send),
+                    daemon=True
+                )
+                worker.start()
+                # The worker holds its own copies; closing ours lets EOF reach either side
+                request_recv.close()
+                response_send.close()
+                workers.append(worker)
+                requests.append((request_send, threading.Lock()))
+                responses.append(response_recv)
+
+            try:
+                self._wait_ready(workers, responses)
+            except Exception:
+                self._shutdown(workers, requests)
+                raise
+
+            self._requests, self._responses = requests, responses
+            threading.Thread(target=self._dispatch, daemon=True).start()
+            self._workers = workers
+
+    def _wait_ready(self, workers, responses):
+        deadline = time.time() + self.start_timeout
+        for shard_id, (worker, conn) in enumerate(zip(workers, responses)):
+            while not conn.poll(0.5):
+                self._check_workers(workers)
+                if time.time() > deadline:
+                    raise TimeoutError(f'Shard worker {shard_id} not ready after {self.start_timeout}s')
+            try:
+                _, count = conn.recv()
+            except EOFError:
+                raise ShardWorkerError(f'Shard worker {shard_id} exited during startup (exit code {worker.exitcode})')
+            logger.info(f'Shard {shard_id} ready ({count} documents)')
+
+    def search(self, query_vector: np.ndarray, fetch_k: int, timeout: float = None):
+        """Scatter the query to every shard and gather the merged global top fetch_k"""
+        self._ensure_started()
+        self._check_workers()
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = {'future': future, 'parts': [], 'remaining': self.num_shards}
+
+        message = (request_id, np.asarray(query_vector, dtype=np.float32), fetch_k)
+        for conn, send_lock in self._requests:
+            with send_lock:
+                conn.send(message)
+
+        try:
+            parts = future.result(timeout=timeout or sharding_settings['timeout'])
+        except FutureTimeoutError:
+            # A dead worker never answers; report that rather than a bare timeout
+            self._check_workers()
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+        scores = np.concatenate([part[1] for part in parts])
+        shards = np.concatenate([np.full(len(part[1]), part[0]) for part in parts])
+        rows = np.concatenate([part[2] for part in parts])
+        top = np.argsort(-scores)[:fetch_k]
+
+        hits = []
+        for i in top:
+            snapshot, row = self.snapshots[shards[i]], int(rows[i])
+            hits.append((float(scores[i]), np.asarray(snapshot.vectors[row]), snapshot.columns['document'][row], snapshot.metadata(row)))
+        return hits
+
+    def _dispatch(self):
+        from multiprocessing.connection import wait
+
+        shard_of = {conn: shard_id for shard_id, conn in enumerate(self._responses)}
+        open_conns = list(self._responses)
+        while open_conns:
+            for conn in wait(open_conns):
+                shard_id = shard_of[conn]
+                try:
+                    request_id, scores, rows = conn.recv()
+                except (EOFError, OSError):
+                    open_conns.remove(conn)
+                    self._fail_pending(ShardWorkerError(f'Shard worker {shard_id} died'))
+                    continue
+                with self._lock:
+                    pending = self._pending.get(request_id)
+                    if pending is None:
+                        continue
+                    if isinstance(scores, Exception):
+                        pending['future'].set_exception(scores)
+                        self._pending.pop(request_id)
+                        continue
+                    pending['parts'].append((shard_id, scores, rows))
+                    pending['remaining'] -= 1
+                    if pending['remaining'] == 0:
+                        pending['future'].set_result(pending['parts'])
+
+    def _fail_pending(self, error: Exception):
+        with self._lock:
+            for pending in self._pending.values():
+                if not pending['future'].done():
+                    pending['future'].set_exception(error)
+            self._pending.clear()
+
+    def _check_workers(self, workers=None):
+        for shard_id, worker in enumerate(workers or self._workers):
+            if not worker.is_alive():
+                raise ShardWorkerError(f'Shard worker {shard_id} died (exit code {worker.exitcode})')
+
+    @staticmethod
+    def _shutdown(workers, requests):
+        for conn, send_lock in requests:
+            try:
+                with send_lock:
+                    conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in workers:
+            worker.join(timeout=5)
+
+    def close(self):
+        if not self._workers:
+            return
+        self._shutdown(self._workers, self._requests)
+        for conn, _ in self._requests:
+            conn.close()
+
+
+class ShardedRetriever:
+    """Retriever over a ShardedIndex; same MMR settings as the Chroma retriever"""
+
+    def __init__(self, index: ShardedIndex, embeddings=None, k: int = None, fetch_k: int = None, lambda_mult: float = None):
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k or retrival_settings['k']
+        self.fetch_k = fetch_k or retrival_settings['fetch_k']
+        self.lambda_mult = lambda_mult if lambda_mult is not None else retrival_settings['lambda_mult']
+
+    def embed_query(self, question: str):
+        if self.embeddings is None:
+            from vector_config import get_embeddings
+            self.embeddings = get_embeddings()
+        return self.embeddings.embed_query(question)
+
+    def invoke(self, question: str):
+        from langchain_core.documents import Document
+        from snapshot import normalize_vectors, mmr_select
+
+        query_vector = normalize_vectors(np.asarray([self.embed_query(question)], dtype=np.float32))[0]
+        hits = self.index.search(query_vector, self.fetch_k)
+        if not hits:
+            return []
+
+        candidates = np.stack([hit[1] for hit in hits])
+        chosen = mmr_select(query_vector, candidates, self.k, self.lambda_mult)
+        return [Document(page_content=hits[i][2], metadata=hits[i][3]) for i in chosen]
+
+
+def load_sharded_retriever(shard_dir: str = None, embeddings=None):
+    return ShardedRetriever(ShardedIndex(shard_dir), embeddings)
+
+
+def benchmark_shards(num_docs: int = 50000, dim: int = 1024, shard_counts=None, queries: int = 1000, clients: int = 8, fetch_k: int = None):
+    """
+    Search throughput over shard counts on a synthetic corpus, against an
+    in-process search of the same vectors as a single snapshot. Queries are
+    issued by `clients` threads so concurrent searches overlap.
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from snapshot import IndexSnapshot, normalize_vectors, write_snapshot
+
+    fetch_k = fetch_k or retrival_settings['fetch_k']
+    cores = os.cpu_count() or 1
+    shard_counts = shard_counts or sorted({1, 2, 4, cores, 2 * cores})
+    rng = np.random.default_rng(0)
+    vectors = normalize_vectors(rng.standard_normal((num_docs, dim), dtype=np.float32))
+    query_vectors = normalize_vectors(rng.standard_normal((queries, dim), dtype=np.float32))
+    ids = [str(i) for i in range(num_docs)]
+
+    def run(search):
+        latencies = []
+
+        def one(q):
+            start = time.perf_counter()
+            search(q)
+            latencies.append(time.perf_counter() - start)
+
+        search(query_vectors[0])  # warm up
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(one, query_vectors))
+        elapsed = time.perf_counter() - start
+        return queries / elapsed, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'single.ragsnap')
+        write_snapshot(path, ids, ids, [{} for _ in ids], vectors)
+        single = IndexSnapshot(path)
+
+        def single_search(q):
+            scores = single.vectors @ q
+            top = np.argpartition(-scores, fetch_k - 1)[:fetch_k]
+            return [(float(scores[i]), np.asarray(single.vectors[i]), single.columns['document'][i], single.metadata(int(i))) for i in top]
+
+        rows.append(('single', *run(single_search)))
+
+        for num_shards in shard_counts:
+            shard_dir = os.path.join(workdir, f'shards-{num_shards}')
+            os.makedirs(shard_dir)
+            parts = [[] for _ in range(num_shards)]
+            for i, doc_id in enumerate(ids):
+                parts[shard_for(doc_id, num_shards)].append(i)
+            for shard_id, part in enumerate(parts):
+                part_ids = [ids[i] for i in part]
+                write_snapshot(shard_path(shard_dir, shard_id), part_ids, part_ids, [{} for _ in part], vectors[part])
+            with open(os.path.join(shard_dir, _MANIFEST), 'w') as f:
+                json.dump({'num_shards': num_shards, 'embedding_model': EMBEDDING_MODEL, 'count': num_docs}, f)
+
+            index = ShardedIndex(shard_dir)
+            try:
+                rows.append((f'{num_shards} shards', *run(lambda q: index.search(q, fetch_k))))
+            finally:
+                index.close()
+
+    print(f'\n Shard Throughput : {num_docs} docs x {dim} dims, {queries} queries, {clients} clients, {cores} cores')
+    print('-' * 60)
+    print(f"{'index':<12}{'queries/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}")
+    for name, qps, p50, p95 in rows:
+        print(f'{name:<12}{qps:>12.1f}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}{qps / rows[0][1]:>9.2f}x')
+    return rows
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'build':
+        build_shards_from_csv(CSV_FILE, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elif command == 'bench':
+        benchmark_shards(*(int(arg) for arg in sys.argv[2:4]))
+    else:
+        print('Usage: python src/sharding.py build [num_shards] | bench [num_docs] [dim]')
+        sys.exit(1)
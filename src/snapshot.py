@@ -0,0 +1,287 @@
+# snapshot.py
+"""
+Portable single-file index snapshots.
+
+Layout of a snapshot file:
+
+    MAGIC (8 bytes) | manifest length (8 bytes, little endian) | manifest JSON
+    | padding to 64 bytes | float32 vector block (count x dim) | zlib columnar metadata
+
+The manifest records the format version, embedding model, vector shape, block
+offsets and a sha256 per block. Vectors are stored L2-normalized so the loader
+can memory-map them and score queries with a single matrix-vector product.
+
+Usage:
+    python src/snapshot.py export data/reviews.ragsnap
+    python src/snapshot.py import data/reviews.ragsnap     # restore into Chroma
+    python src/snapshot.py verify data/reviews.ragsnap
+"""
+from config import EMBEDDING_MODEL, DATA_PATH, retrival_settings, vector_store_settings, snapshot_settings
+import numpy as np
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RAGSNAP\x00'
+FORMAT_VERSION = 1
+_ALIGN = 64
+_METADATA_COLUMNS = ['title', 'rating', 'date', 'source', 'doc_id', 'duplicates']
+
+
+def _sha256(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def write_snapshot(path: str, ids, documents, metadatas, embeddings, embedding_model: str = EMBEDDING_MODEL):
+    """Write collection contents to a single snapshot file"""
+    start_time = time.time()
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.size == 0:
+        # An empty partition (e.g. a shard that got no documents) is a valid snapshot
+        vectors = vectors.reshape(0, 0)
+    else:
+        vectors = normalize_vectors(vectors)
+    count, dim = vectors.shape
+
+    columns = {'id': list(ids), 'document': list(documents)}
+    for name in _METADATA_COLUMNS:
+        columns[name] = [(m or {}).get(name) for m in metadatas]
+    metadata_block = zlib.compress(json.dumps(columns, default=str).encode('utf-8'), 6)
+    vector_block = np.ascontiguousarray(vectors).tobytes()
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'embedding_model': embedding_model,
+        'collection_name': vector_store_settings['collection_name'],
+        'count': int(count),
+        'dim': int(dim),
+        'dtype': 'float32',
+        'normalized': True,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'vectors': {'length': len(vector_block), 'sha256': _sha256(vector_block)},
+        'metadata': {'length': len(metadata_block), 'sha256': _sha256(metadata_block), 'codec': 'zlib+json'}
+    }
+
+    # Offsets depend on the manifest size, so iterate until the header settles
+    vector_offset = 0
+    while True:
+        manifest['vectors']['offset'] = vector_offset
+        manifest['metadata']['offset'] = vector_offset + len(vector_block)
+        header_len = len(MAGIC) + 8 + len(json.dumps(manifest).encode('utf-8'))
+        aligned = -(-header_len // _ALIGN) * _ALIGN
+        if aligned == vector_offset:
+            break
+        vector_offset = aligned
+
+    manifest_bytes = json.dumps(manifest).encode('utf-8')
+    header_len = len(MAGIC) + 8 + len(manifest_bytes)
+    padding = manifest['vectors']['offset'] - header_len
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(manifest_bytes)))
+        f.write(manifest_bytes)
+        f.write(b'\x00' * padding)
+        f.write(vector_block)
+        f.write(metadata_block)
+    os.replace(tmp_path, path)
+
+    logger.info(f'Snapshot written to {path} : {count} vectors x {dim} in {time.time() - start_time:.2f}s')
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a snapshot file')
+        (length,) = struct.unpack('<Q', f.read(8))
+        manifest = json.loads(f.read(length).decode('utf-8'))
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest.get('format_version')}")
+    return manifest
+
+
+class IndexSnapshot:
+    """Memory-mapped view of a snapshot file"""
+
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        self.manifest = read_manifest(path)
+
+        count, dim = self.manifest['count'], self.manifest['dim']
+        self.vectors = np.memmap(
+            path, dtype=np.float32, mode='r',
+            offset=self.manifest['vectors']['offset'], shape=(count, dim)
+        ) if count else np.zeros((0, 0), dtype=np.float32)
+
+        meta = self.manifest['metadata']
+        with open(path, 'rb') as f:
+            f.seek(meta['offset'])
+            metadata_block = f.read(meta['length'])
+        if _sha256(metadata_block) != meta['sha256']:
+            raise ValueError(f'Snapshot metadata checksum mismatch in {path}')
+        self.columns = json.loads(zlib.decompress(metadata_block).decode('utf-8'))
+
+        if verify:
+            self.verify()
+
+    def __len__(self):
+        return self.manifest['count']
+
+    def verify(self):
+        """Full checksum of the vector block; reads every page, so it is opt-in"""
+        if _sha256(np.ascontiguousarray(self.vectors).tobytes()) != self.manifest['vectors']['sha256']:
+            raise ValueError(f'Snapshot vector checksum mismatch in {self.path}')
+
+    def ids(self):
+        return self.columns['id']
+
+    def metadata(self, i: int) -> dict:
+        return {
+            name: self.columns[name][i] for name in _METADATA_COLUMNS
+            if name in self.columns and self.columns[name][i] is not None
+        }
+
+    def document(self, i: int):
+        from langchain_core.documents import Document
+        return Document(page_content=self.columns['document'][i], metadata=self.metadata(i))
+
+
+def mmr_select(query_vector: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float):
+    """Maximal Marginal Relevance over normalized vectors; returns positions into candidates"""
+    if len(candidates) == 0:
+        return []
+    query_sim = candidates @ query_vector
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(query_sim))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = pairwise[:, selected].max(axis=1)
+        scores = lambda_mult * query_sim - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+class SnapshotRetriever:
+    """
+    Retriever served straight from a memory-mapped snapshot. Only the query is
+    embedded; search is a dot product over the vector block followed by MMR,
+    mirroring the settings used for the Chroma retriever.
+    """
+
+    def __init__(self, snapshot: IndexSnapshot, embeddings=None, k: int = None, fetch_k: int = None, lambda_mult: float = None):
+        self.snapshot = snapshot
+        self.embeddings = embeddings
+        self.k = k or retrival_settings['k']
+        self.fetch_k = fetch_k or retrival_settings['fetch_k']
+        self.lambda_mult = lambda_mult if lambda_mult is not None else retrival_settings['lambda_mult']
+
+    def embed_query(self, question: str):
+        if self.embeddings is None:
+            from vector_config import get_embeddings
+            self.embeddings = get_embeddings()
+        return self.embeddings.embed_query(question)
+
+    def invoke(self, question: str):
+        query_vector = normalize_vectors(np.asarray([self.embed_query(question)], dtype=np.float32))[0]
+        return self.search_by_vector(query_vector)
+
+    def search_by_vector(self, query_vector: np.ndarray):
+        vectors = self.snapshot.vectors
+        if len(vectors) == 0:
+            return []
+        scores = vectors @ query_vector
+        fetch_k = min(self.fetch_k, len(scores))
+        top = np.argpartition(-scores, fetch_k - 1)[:fetch_k]
+        top = top[np.argsort(-scores[top])]
+
+        chosen = mmr_select(query_vector, np.asarray(vectors[top]), self.k, self.lambda_mult)
+        return [self.snapshot.document(int(top[i])) for i in chosen]
+
+
+def load_snapshot_retriever(path: str, embeddings=None):
+    """Open a snapshot for serving; refuses snapshots built with another embedding model"""
+    start_time = time.time()
+    snapshot = IndexSnapshot(path)
+
+    if snapshot.manifest['embedding_model'] != EMBEDDING_MODEL:
+        raise ValueError(
+            f"Snapshot built with {snapshot.manifest['embedding_model']}, "
+            f"but EMBEDDING_MODEL is {EMBEDDING_MODEL}"
+        )
+
+    logger.info(f'Loaded snapshot {path} ({len(snapshot)} vectors) in {time.time() - start_time:.2f}s')
+    return SnapshotRetriever(snapshot, embeddings)
+
+
+def _open_collection():
+    from langchain_chroma import Chroma
+    from vector_config import get_embeddings
+
+    return Chroma(
+        collection_name=vector_store_settings['collection_name'],
+        persist_directory=DATA_PATH,
+        embedding_function=get_embeddings()
+    )
+
+
+def export_snapshot(path: str):
+    """Dump the persisted Chroma collection to a snapshot file"""
+    vector_store = _open_collection()
+    data = vector_store._collection.get(include=['embeddings', 'documents', 'metadatas'])
+    if not len(data['ids']):
+        raise ValueError('Collection is empty, nothing to export')
+    return write_snapshot(path, data['ids'], data['documents'], data['metadatas'], data['embeddings'])
+
+
+def import_snapshot(path: str, batch_size: int = 500):
+    """Restore a snapshot into the Chroma persist directory without embedding calls"""
+    snapshot = IndexSnapshot(path, verify=True)
+    if snapshot.manifest['embedding_model'] != EMBEDDING_MODEL:
+        raise ValueError(f"Snapshot built with {snapshot.manifest['embedding_model']}, not {EMBEDDING_MODEL}")
+
+    collection = _open_collection()._collection
+    ids = snapshot.ids()
+    for i in range(0, len(ids), batch_size):
+        end = min(i + batch_size, len(ids))
+        collection.upsert(
+            ids=ids[i:end],
+            embeddings=np.asarray(snapshot.vectors[i:end]).tolist(),
+            documents=snapshot.columns['document'][i:end],
+            metadatas=[snapshot.metadata(j) for j in range(i, end)]
+        )
+    logger.info(f'Imported {len(ids)} vectors from {path}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    target = sys.argv[2] if len(sys.argv) > 2 else snapshot_settings['path']
+
+    if command == 'export':
+        export_snapshot(target)
+    elif command == 'import':
+        import_snapshot(target)
+    elif command == 'verify':
+        IndexSnapshot(target, verify=True)
+        print(json.dumps(read_manifest(target), indent=2))
+    else:
+        print('Usage: python src/snapshot.py [export|import|verify] [path]')
+        sys.exit(1)
@@ -1,74 +1,32 @@
 # vector_config.py
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
+# langchain, chroma and pandas are imported inside the functions that need them
+# so entry points that serve from a snapshot never pay for them at startup.
 import os
-import pandas as pd
-from config import CSV_FILE, DATA_PATH, EMBEDDING_MODEL, retrival_settings, vector_store_settings
+from config import CSV_FILE, DATA_PATH, EMBEDDING_MODEL, retrival_settings, vector_store_settings, snapshot_settings, sharding_settings
 import logging
+import threading
 import time
 
-logging.basicConfig(level=logging.INFO)
 logger= logging.getLogger(__name__)
 
 _embeddings_instance = None
+_embeddings_lock = threading.Lock()
 
 def get_embeddings():
     global _embeddings_instance
     if _embeddings_instance is None:
-        logger.info(f'Initializing instance : {EMBEDDING_MODEL}')
-        _embeddings_instance = OllamaEmbeddings(model=EMBEDDING_MODEL)
+        with _embeddings_lock:
+            if _embeddings_instance is None:
+                from pooled_models import PooledOllamaEmbeddings
+                logger.info(f'Initializing instance : {EMBEDDING_MODEL}')
+                _embeddings_instance = PooledOllamaEmbeddings(model=EMBEDDING_MODEL)
     return _embeddings_instance
 
-def load_data_from_csv(csv_path:str):
-    logger.info(f'Loading data from {csv_path}')
-    start_time = time.time()
-    try:
-        df = pd.read_csv('csv_path')
-        logger.info(f'Loaded {len(df)} rows from csv file.')
-
-        documents = []
-        ids = []
-
-        for i, row in df.iterrows():
-            title = str(row.get('Title', '')).strip()
-            review = str(row.get('Review', '')).strip()
-            rating = row.get('Rating', 'N/A')
-            date = row.get('Date', 'N/A')
+def load_data_from_csv(csv_path: str, id_prefix: str = ''):
+    """Optimized CSV loading with better document creation; ids are id_prefix + row number"""
+    import pandas as pd
+    from langchain_core.documents import Document
 
-            if not review or review.lower() in ['nan', 'none', '']:
-                continue
-
-            content = f'Restaurant: {title}\nReview: {review}'
-
-            doc = Document(
-                page_content = content,
-                metadata = {
-                    'title' : title,
-                    'rating' : rating,
-                    'date' : date,
-                    'source' : 'csv',
-                    'doc_id' : str(i)
-                }
-            )
-            documents.append(doc)
-            ids.append(str(i))
-
-        load_time = time.time() - start_time
-        logger.info(f'Document preparation: {load_time:.2f}s | Created {len(documents)} documents')
-
-        return documents, ids
-    except Exception as e:
-        logger.error(f'Error occured  loading csv :{e}')
-        return [], []
-    
-
-
-
-
-
-def load_data_from_csv(csv_path: str):
-    """Optimized CSV loading with better document creation"""
     logger.info(f"📂 Loading data from: {csv_path}")
     start_time = time.time()
     
@@ -100,11 +58,11 @@ def load_data_from_csv(csv_path: str):
                     'rating': rating, 
                     'date': date,
                     'source': 'csv',
-                    'doc_id': str(i)
+                    'doc_id': f'{id_prefix}{i}'
                 }
             )
             documents.append(doc)
-            ids.append(str(i))
+            ids.append(f'{id_prefix}{i}')
         
         load_time = time.time() - start_time
         logger.info(f"⏱️ Document preparation: {load_time:.2f}s | Created {len(documents)} documents")
@@ -115,11 +73,53 @@ def load_data_from_csv(csv_path: str):
         logger.error(f"❌ Error loading CSV: {e}")
         return [], []
 
+def ingest_documents(vector_store, documents, ids, fresh: bool = False):
+    """
+    Add a batch to the vector store, embedding one representative per group of
+    near-duplicate reviews. The batch is checked against the persisted signature
+    index, so repeated ingestion runs fold copies of already stored reviews too.
+    """
+    from dedup import SignatureIndex, apply_duplicate_counts
+
+    signature_index = SignatureIndex() if fresh else SignatureIndex.load()
+    documents, ids, updated = signature_index.deduplicate(documents, ids)
+
+    # Add documents in batches for better performance
+    batch_size = 50
+    for i in range(0, len(documents), batch_size):
+        batch_docs = documents[i:i + batch_size]
+        batch_ids = ids[i:i + batch_size]
+        vector_store.add_documents(documents=batch_docs, ids=batch_ids)
+        logger.info(f"📝 Added batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}")
+
+    apply_duplicate_counts(vector_store._collection, updated)
+    signature_index.save()
+    return len(documents)
+
 def create_vectorstore():
     """Optimized vector store creation with better configuration"""
     logger.info("🚀 Setting up vector store...")
     start_time = time.time()
     
+    # A snapshot needs no embedding calls for the corpus, so a new replica is up in seconds.
+    # The embeddings client is resolved on the first query so it stays off the startup path.
+    if snapshot_settings['prefer_snapshot'] and os.path.exists(snapshot_settings['path']):
+        from snapshot import load_snapshot_retriever
+        logger.info(f"📦 Serving from snapshot: {snapshot_settings['path']}")
+        return load_snapshot_retriever(snapshot_settings['path'])
+
+    if sharding_settings['enabled']:
+        from sharding import build_shards_from_csv, load_sharded_retriever
+        if not os.path.exists(os.path.join(sharding_settings['dir'], 'shards.json')):
+            # Ingestion for sharded serving: every shard is embedded in its own process
+            logger.info(f"🧩 No shards yet, building them from: {CSV_FILE}")
+            build_shards_from_csv(CSV_FILE)
+
+            from analytics import build_summary
+            build_summary(CSV_FILE)
+        logger.info(f"🧩 Serving from shards in: {sharding_settings['dir']}")
+        return load_sharded_retriever(sharding_settings['dir'])
+
     embeddings = get_embeddings()
     
     # Use DATA_PATH directly
@@ -132,30 +132,28 @@ def create_vectorstore():
         logger.info(f"🔍 Looking for file at: {os.path.abspath(csv_file_path)}")
         raise FileNotFoundError(f"CSV file not found: {csv_file_path}")
     
-    # Check if vector store already exists
-    chroma_file_path = os.path.join(DATA_PATH, 'chroma-collections.parquet')
-    
+    from langchain_chroma import Chroma
+
     vector_store = Chroma(
         collection_name=vector_store_settings['collection_name'],
         persist_directory=DATA_PATH,
         embedding_function=embeddings
     )
     
-    # Add documents if vector store is empty or doesn't exist
-    if not os.path.exists(chroma_file_path) or vector_store._collection.count() == 0:
+    # Add documents only if the collection is empty; current Chroma persists to
+    # chroma.sqlite3, so the old chroma-collections.parquet check was always true
+    if vector_store._collection.count() == 0:
         logger.info("📦 Vector store empty, adding documents...")
         add_start = time.time()
         
         documents, ids = load_data_from_csv(csv_file_path)
         
         if documents:
-            # Add documents in batches for better performance
-            batch_size = 50
-            for i in range(0, len(documents), batch_size):
-                batch_docs = documents[i:i + batch_size]
-                batch_ids = ids[i:i + batch_size]
-                vector_store.add_documents(documents=batch_docs, ids=batch_ids)
-                logger.info(f"📝 Added batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}")
+            # The store is empty, so any saved signature index is stale
+            ingest_documents(vector_store, documents, ids, fresh=True)
+
+            from analytics import build_summary
+            build_summary(csv_file_path)
             
             add_time = time.time() - add_start
             logger.info(f"✅ Documents added in {add_time:.2f}s")
@@ -179,6 +177,26 @@ def create_vectorstore():
     
     return retriever
 
+def ingest_csv(csv_path: str):
+    """
+    Add a CSV of new reviews to the existing vector store. The batch is checked
+    against the saved signature index, so copies of reviews already stored are
+    folded into their representatives instead of being embedded again.
+    """
+    from langchain_chroma import Chroma
+
+    vector_store = Chroma(
+        collection_name=vector_store_settings['collection_name'],
+        persist_directory=DATA_PATH,
+        embedding_function=get_embeddings()
+    )
+    # Row numbers restart in every file, so ids are prefixed with the file name
+    prefix = os.path.splitext(os.path.basename(csv_path))[0] + ':'
+    documents, ids = load_data_from_csv(csv_path, id_prefix=prefix)
+    added = ingest_documents(vector_store, documents, ids)
+    logger.info(f"✅ {added} of {len(ids)} reviews from {csv_path} embedded")
+    return added
+
 
 
 
@@ -319,3 +337,13 @@ def create_vectorstore():
 # #         vector_store.add_documents(documents=documents, ids=ids)
 
 # #     return vector_store.as_retriever(search_kwargs={'k':5})
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 3 or sys.argv[1] != 'ingest':
+        print('Usage: python src/vector_config.py ingest path/to/new_reviews.csv')
+        sys.exit(1)
+    ingest_csv(sys.argv[2])